@@ -1,189 +1,319 @@
 from PIL import Image, ImageDraw, ImageFont
-import textwrap
+import functools
+import io
+import unicodedata
 from model import Confession
 import os
 IMAGE_OUTPUT_DIR = "generated_images"
+FONT_PATH = "assets/NotoSansDevanagari-Regular.ttf"
+# Fallbacks when the bundled font is missing, tried in order before Pillow's default font
+SYSTEM_FONT_PATHS = [
+    "/usr/share/fonts/truetype/noto/NotoSansDevanagari-Regular.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "C:/Windows/Fonts/arial.ttf",
+]
+# Slides only use the three scheme colors plus anti-aliasing ramps between them
+PALETTE_COLORS = 16
 
-if not os.path.exists(IMAGE_OUTPUT_DIR):
-    os.makedirs(IMAGE_OUTPUT_DIR)
+@functools.cache
+def _ensure_output_dir() -> None:
+    """Create the output directory on first use instead of at import"""
+    os.makedirs(IMAGE_OUTPUT_DIR, exist_ok=True)
+
+@functools.lru_cache(maxsize=None)
+def _get_font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    """Load a TrueType font once per (path, size) and reuse it across slides"""
+    return ImageFont.truetype(path, size)
+
+def _load_fonts():
+    """Load NotoSansDevanagari font, falling back to system fonts and then Pillow's default"""
+    # Probe with a stat first so absent candidates cost no FreeType open
+    for font_path in filter(os.path.isfile, [FONT_PATH, *SYSTEM_FONT_PATHS]):
+        try:
+            return _get_font(font_path, 50), _get_font(font_path, 32), _get_font(font_path, 24)
+        except OSError as e:
+            print(f"Font loading error for {font_path}: {e}")
+    print(f"No usable font found in {[FONT_PATH, *SYSTEM_FONT_PATHS]}, using Pillow's default font.")
+    default_font = ImageFont.load_default()
+    return default_font, default_font, default_font
+
+# Loaded once at import so rendering a slide is just a global lookup
+FONT_LARGE, FONT_MEDIUM, FONT_SMALL = _load_fonts()
+
+def _encode_png(img: Image.Image, buffer: io.BytesIO) -> None:
+    """Encode a PNG with fast compression unless optimization is explicitly requested"""
+    # 1 byte per pixel instead of 3 means far less data through the filter/deflate stages;
+    # grayscale slides are already there
+    paletted = img if img.mode == 'L' else img.quantize(colors=PALETTE_COLORS, method=Image.Quantize.FASTOCTREE)
+    try:
+        # Full optimization is slow and barely helps on flat slides; opt in with PAGE_AUTOMATION_OPTIMIZE=1
+        # for archival builds. Read per encode rather than at import, so a .env loaded in __main__ is seen
+        if os.getenv("PAGE_AUTOMATION_OPTIMIZE") == "1":
+            paletted.save(buffer, format="PNG", optimize=True)
+        else:
+            paletted.save(buffer, format="PNG", compress_level=3, optimize=False)
+    finally:
+        # Free the temporary frame now rather than whenever it is collected; img is the shared canvas
+        if paletted is not img:
+            paletted.close()
+
+def _encode_image(img: Image.Image, output_format: str) -> memoryview:
+    """Encode a slide in memory as JPEG (default, cheap to encode) or PNG"""
+    buffer = io.BytesIO()
+    if output_format == "png":
+        _encode_png(img, buffer)
+    else:
+        # Uploads stay 3-channel JPEGs, the format Instagram documents, even for grayscale slides
+        with img.convert('RGB') as rgb:
+            rgb.save(buffer, format="JPEG", quality=90, optimize=False, subsampling=2, progressive=False)
+    return buffer.getbuffer()
+
+def _write_file(path: str, data: memoryview) -> None:
+    """Write an encoded image with a single writev instead of many small encoder writes"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        while data:
+            written = os.writev(fd, [data])
+            data = data[written:]
+    finally:
+        os.close(fd)
+
+def _save_image(img: Image.Image, image_path: str, output_format: str) -> None:
+    """Encode and write a slide to disk"""
+    _write_file(image_path, _encode_image(img, output_format))
+
+@functools.lru_cache(maxsize=4096)
+def _text_width(font, text: str) -> float:
+    """Advance width of text in pixels; words repeat across lines and slides, so measure each once"""
+    return font.getlength(text)
+
+@functools.lru_cache(maxsize=None)
+def _line_spacing(font, line_height: int) -> int:
+    """multiline_text spacing that gives a line pitch of line_height (Pillow's pitch is the height of "A" plus spacing)"""
+    return line_height - font.getbbox("A")[3]
+
+def _split_long_word(word: str, font, max_width: int) -> tuple[str, str]:
+    """Split off the longest prefix of word that fits max_width, keeping combining marks with their base"""
+    lo, hi = 1, len(word) - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if font.getlength(word[:mid]) <= max_width:
+            lo = mid
+        else:
+            hi = mid - 1
+    # Don't split a vowel sign or other combining mark off its base character
+    while lo > 1 and unicodedata.category(word[lo]).startswith('M'):
+        lo -= 1
+    return word[:lo], word[lo:]
+
+def _wrap_pixels(text: str, font, max_width: int) -> list[str]:
+    """Greedy word wrap against a pixel width, summing cached per-word widths instead of re-measuring lines"""
+    space = _text_width(font, " ")
+    words = text.split()
+    lines = []
+    current, current_width = [], 0.0
+    i = 0
+    while i < len(words):
+        word = words[i]
+        width = _text_width(font, word)
+        if current and current_width + space + width <= max_width:
+            current.append(word)
+            current_width += space + width
+        elif current:
+            lines.append(" ".join(current))
+            current, current_width = [], 0.0
+            continue
+        elif width > max_width and len(word) > 1:
+            # Word is too long for a line on its own; the remaining fragment starts the next line
+            head, words[i] = _split_long_word(word, font, max_width)
+            lines.append(head)
+            continue
+        else:
+            current, current_width = [word], width
+        i += 1
+    if current:
+        lines.append(" ".join(current))
+    return lines
+
+def _grayscale_scheme(colors: dict) -> dict:
+    """Collapse an all-gray RGB color scheme to 'L' values, so the slide is drawn at 1 byte per pixel"""
+    if all(isinstance(c, tuple) and c[0] == c[1] == c[2] for c in colors.values()):
+        return {name: c[0] for name, c in colors.items()}
+    return colors
+
+# Header masks are 1080x150 and a run needs two per confession (with and without the ID)
+@functools.lru_cache(maxsize=8)
+def _header_mask(font, width: int, count: int | None) -> Image.Image:
+    """Coverage mask of the watermark strip, plus "#count" when count is given, so static text is shaped once"""
+    mask = Image.new('L', (width, 150), 0)
+    draw = ImageDraw.Draw(mask)
+    watermark = "IITK QUICK CONFESSIONS"
+    draw.text((width // 2, 50), 
+                watermark, font=font, fill=255, anchor="mm")
+    if count is not None:
+        id_text = f"#{count}"
+        draw.text((width // 2, 100), 
+                id_text, font=font, fill=255, anchor="mm")
+    return mask
+
+# Indicator tiles are tiny; this covers every "n/N" up to 10 slides in a few color schemes
+@functools.lru_cache(maxsize=256)
+def _indicator_tile(font, text: str, fg, bg) -> Image.Image:
+    """Rendered "n/N" indicator box in the slide's colors ('L' for gray levels), shaped once per text and scheme"""
+    indicator_bbox = font.getbbox(text)
+    indicator_width = indicator_bbox[2] - indicator_bbox[0]
+    # Indicator background box, text is drawn 10px in and 5px down
+    tile = Image.new('L' if isinstance(fg, int) else 'RGB', (indicator_width + 21, 31), fg)
+    ImageDraw.Draw(tile).text((10, 5), text, font=font, fill=bg)
+    return tile
 
 class ConfessionImageGenerator:
-    def __init__(self, confession: Confession):
+    # One reusable canvas per frame size, cleared to the background color for every slide.
+    # Kept per class (not per instance) since every confession builds its own generator.
+    _canvas_cache: dict[tuple[tuple[int, int], str], tuple[Image.Image, ImageDraw.ImageDraw]] = {}
+
+    def __init__(self, confession: Confession, output_format: str = "jpg"):
         self.confession = confession
+        self.output_format = output_format  # "jpg" or "png"
         self.img_width = 1080
         self.img_height = 1080
         self.margin = 80
         self.line_spacing = 15
         self.max_chars_per_slide = 400  # Adjust based on readability
     
-    def load_fonts(self):
-        """Load NotoSansDevanagari font"""
-        try:
-            font_path = "assets/NotoSansDevanagari-Regular.ttf"
-            font_large = ImageFont.truetype(font_path, 50)
-            font_medium = ImageFont.truetype(font_path, 32)
-            font_small = ImageFont.truetype(font_path, 24)
-            return font_large, font_medium, font_small
-        except Exception as e:
-            print(f"Font loading error: {e}")
-            default_font = ImageFont.load_default()
-            return default_font, default_font, default_font
-    
-    def create_solid_background(self, colors: dict) -> Image.Image:
-        """Create a solid background image"""
-        img = Image.new('RGB', (self.img_width, self.img_height), color=colors['bg'])
-        return img
+    def create_solid_background(self, colors: dict, size: tuple[int, int] | None = None
+                                ) -> tuple[Image.Image, ImageDraw.ImageDraw]:
+        """
+        Return the reusable canvas (slide size by default) cleared to a solid background, with its draw object.
+        The canvas is 'L' when the colors are single gray levels (see _grayscale_scheme), 'RGB' otherwise.
+        """
+        size = size or (self.img_width, self.img_height)
+        mode = 'L' if isinstance(colors['bg'], int) else 'RGB'
+        cached = self._canvas_cache.get((size, mode))
+        if cached is None:
+            canvas = Image.new(mode, size, color=colors['bg'])
+            draw = ImageDraw.Draw(canvas, mode)
+            self._canvas_cache[(size, mode)] = (canvas, draw)
+        else:
+            canvas, draw = cached
+            draw.rectangle([(0, 0), size], fill=colors['bg'])
+        return canvas, draw
     
     def split_text_into_slides(self) -> list[str]:
-        """Split long text into readable slides"""
-        if len(self.confession.text) <= self.max_chars_per_slide:
-            return [self.confession.text]
-        
-        # Split by sentences first
-        sentences = self.confession.text.replace('!', '.').replace('?', '.').split('.')
-        sentences = [s.strip() for s in sentences if s.strip()]
-        
-        slides = []
-        current_slide = ""
-        
-        for sentence in sentences:
-            # If sentence is too long, split by commas
-            if len(sentence) > self.max_chars_per_slide:
-                comma_chunks = sentence.split(',')
-                comma_chunks = [c.strip() for c in comma_chunks if c.strip()]
-                for chunk in comma_chunks:
-                    if len(current_slide) + len(chunk) + 2 > self.max_chars_per_slide:
-                        if current_slide:
-                            slides.append(current_slide.strip())
-                            current_slide = chunk + ","
-                        else:
-                            # Single chunk is too long, split by words
-                            words = chunk.split()
-                            temp_slide = ""
-                            for word in words:
-                                if len(temp_slide) + len(word) + 1 > self.max_chars_per_slide:
-                                    if temp_slide:
-                                        slides.append(temp_slide.strip() + ",")
-                                        temp_slide = word
-                                    else:
-                                        # Single word too long, truncate
-                                        slides.append(word[:self.max_chars_per_slide-3] + "...")
-                                        temp_slide = ""
-                                else:
-                                    temp_slide += " " + word if temp_slide else word
-                            if temp_slide:
-                                current_slide = temp_slide + ","
-                    else:
-                        current_slide += " " + chunk + "," if current_slide else chunk + ","
+        """
+        Split long text into readable slides.
+        Uses optimal-fit (Knuth-Plass style) packing: the fewest slides first, then
+        the most even fill, preferring to break at the end of a sentence.
+        """
+        text = self.confession.text
+        budget = self.max_chars_per_slide  # local lookup in the hot loops below
+        if len(text) <= budget:
+            return [text]
+
+        words = []
+        for word in text.split():
+            if len(word) > budget:
+                # Single word too long, truncate
+                word = word[:budget-3] + "..."
+            words.append(word)
+        n = len(words)
+
+        # prefix[i] = characters of words[:i], each counted with its trailing space
+        prefix = [0]
+        for word in words:
+            prefix.append(prefix[-1] + len(word) + 1)
+
+        sentence_break_penalty = (budget // 2) ** 2
+        clause_break_penalty = (budget // 4) ** 2
+
+        # best[j] = (slide count, badness) for words[:j]; back[j] = start of the last slide
+        best = [(0, 0)] + [None] * n
+        back = [0] * (n + 1)
+        for j in range(1, n + 1):
+            if words[j-1][-1] in ".!?" or j == n:
+                penalty = 0
+            elif words[j-1][-1] == ",":
+                penalty = clause_break_penalty
             else:
-                # Normal sentence handling
-                if len(current_slide) + len(sentence) + 2 > self.max_chars_per_slide:
-                    if current_slide:
-                        slides.append(current_slide.strip())
-                        current_slide = sentence + "."
-                    else:
-                        # Single sentence is too long, split by words
-                        words = sentence.split()
-                        temp_slide = ""
-                        for word in words:
-                            if len(temp_slide) + len(word) + 1 > self.max_chars_per_slide:
-                                if temp_slide:
-                                    slides.append(temp_slide.strip() + ".")
-                                    temp_slide = word
-                                else:
-                                    # Single word too long, truncate
-                                    slides.append(word[:self.max_chars_per_slide-3] + "...")
-                                    temp_slide = ""
-                            else:
-                                temp_slide += " " + word if temp_slide else word
-                        if temp_slide:
-                            current_slide = temp_slide + "."
-                else:
-                    current_slide += " " + sentence + "." if current_slide else sentence + "."
+                penalty = sentence_break_penalty
+
+            for k in range(j - 1, -1, -1):
+                length = prefix[j] - prefix[k] - 1
+                if length > budget and k < j - 1:
+                    break
+                # Underfill on the last slide is charged at half weight: it may run a little short,
+                # but not so short that the earlier slides are packed full around a near-empty one
+                badness = (budget - length) ** 2 // 2 if j == n else (budget - length) ** 2 + penalty
+                candidate = (best[k][0] + 1, best[k][1] + badness)
+                if best[j] is None or candidate < best[j]:
+                    best[j] = candidate
+                    back[j] = k
+
+        slides = []
+        j = n
+        while j > 0:
+            k = back[j]
+            slides.append(" ".join(words[k:j]))
+            j = k
+        slides.reverse()
 
-        if current_slide:
-            slides.append(current_slide.strip())
-        
         return slides
     
     def create_slide_image(self, text: str, slide_num: int, total_slides: int, 
-                          colors: dict) -> str:
-        """Create a single slide image"""
-        font_large, font_medium, font_small = self.load_fonts()
+                          colors: dict) -> bytes:
+        """Create a single slide image, returned encoded in memory for upload"""
+        font_large, font_medium, font_small = FONT_LARGE, FONT_MEDIUM, FONT_SMALL
         
-        # Create background
-        img = self.create_solid_background(colors)
-        draw = ImageDraw.Draw(img)
+        # Create background, single channel when the scheme is all grays
+        colors = _grayscale_scheme(colors)
+        img, draw = self.create_solid_background(colors)
         
-        # Wrap text for better readability
-        wrapped_text = textwrap.fill(text, width=35, break_long_words=False)
-        lines = wrapped_text.split('\n')
+        # Wrap text to the width inside the margins
+        lines = _wrap_pixels(text, font_large, self.img_width - 2 * self.margin)
+        wrapped_text = '\n'.join(lines)
+        line_count = len(lines)
         
         # Calculate text positioning
         line_height = 60
-        total_text_height = len(lines) * line_height
+        total_text_height = line_count * line_height
         start_y = (self.img_height - total_text_height) // 2
         
-        # Draw text (no shadow)
-        for i, line in enumerate(lines):
-            # Calculate x position for center alignment
-            text_bbox = draw.textbbox((0, 0), line, font=font_large)
-            text_width = text_bbox[2] - text_bbox[0]
-            x = (self.img_width - text_width) // 2
-            y = start_y + (i * line_height)
-            
-            draw.text((x, y), line, font=font_large, fill=colors['text'])
+        # Draw all lines centered in one call
+        draw.multiline_text((self.img_width // 2, start_y), wrapped_text, font=font_large,
+                            fill=colors['text'], anchor="ma", spacing=_line_spacing(font_large, line_height),
+                            align="center")
         
         # Add slide indicator
         if total_slides > 1:
-            indicator_text = f"{slide_num}/{total_slides}"
-            indicator_bbox = draw.textbbox((0, 0), indicator_text, font=font_small)
-            indicator_width = indicator_bbox[2] - indicator_bbox[0]
-            
-            # Draw indicator background
-            indicator_x = self.img_width - indicator_width - 30
-            indicator_y = self.img_height - 60
-            draw.rectangle([
-                (indicator_x - 10, indicator_y - 5),
-                (indicator_x + indicator_width + 10, indicator_y + 25)
-            ], fill=colors['text'], outline=colors['text'])
-            
-            draw.text((indicator_x, indicator_y), indicator_text, 
-                     font=font_small, fill=colors['bg'])
+            tile, position = self.get_indicator_tile(slide_num, total_slides, colors, font_small)
+            img.paste(tile, position)
         
-        # Add watermark
-        watermark = "IITK QUICK CONFESSIONS"
-        draw.text(((self.img_width) // 2, 50), 
-                    watermark, font=font_medium, fill=colors['accent'], anchor="mm")
+        # Add watermark, plus confession ID and count on first slide
+        header = self.get_header_mask(font_medium, with_id=slide_num == 1)
+        img.paste(colors['accent'], (0, 0, header.width, header.height), header)
+        # TODO: Add timestamp somewhere, need to think of the best place
         
-        if slide_num == 1:
-            # Add confession ID and count on first slide
-            id_text = f"#{self.confession.count}"
-            draw.text(((self.img_width) // 2, 100), 
-                    id_text, font=font_medium, fill=colors['accent'], anchor="mm")
-            
-            # TODO: Add timestamp somewhere, need to think of the best place
-        
-        # Save image
-        filename = f"confession_{self.confession.row_num}_slide_{slide_num}.png"
-        image_path = os.path.join(IMAGE_OUTPUT_DIR, filename)
-        img.save(image_path, quality=95, optimize=True)
-        
-        return image_path
+        # Encode without touching disk; the slide goes straight to Cloudinary
+        return _encode_image(img, self.output_format).tobytes()
     
+    def get_header_mask(self, font_medium, with_id: bool) -> Image.Image:
+        """Coverage mask of the watermark (and ID) strip, cached per confession count"""
+        return _header_mask(font_medium, self.img_width, self.confession.count if with_id else None)
+
+    def get_indicator_tile(self, slide_num: int, total_slides: int, colors: dict,
+                           font_small) -> tuple[Image.Image, tuple[int, int]]:
+        """Rendered "n/N" indicator box and its paste position, cached across confessions"""
+        tile = _indicator_tile(font_small, f"{slide_num}/{total_slides}", colors['text'], colors['bg'])
+        indicator_x = self.img_width - (tile.width - 21) - 30
+        indicator_y = self.img_height - 60
+        return tile, (indicator_x - 10, indicator_y - 5)
+
     def create_reel_image(self, text: str, colors: dict) -> str:
         """Create a 9:16 reel image with larger font size"""
-        # Load NotoSansDevanagari font with larger sizes for reel
-        try:
-            font_path = "assets/NotoSansDevanagari-Regular.ttf"
-            font_reel_large = ImageFont.truetype(font_path, 50)
-            font_reel_medium = ImageFont.truetype(font_path, 32)
-            font_reel_small = ImageFont.truetype(font_path, 24)
-        except Exception as e:
-            print(f"Font loading error: {e}")
-            font_reel_large = ImageFont.load_default()
-            font_reel_medium = ImageFont.load_default()
-            font_reel_small = ImageFont.load_default()
+        _ensure_output_dir()
+        # Reel uses the same font sizes as the slides
+        font_reel_large, font_reel_medium = FONT_LARGE, FONT_MEDIUM
         
         # 9:16 aspect ratio (1080x1920)
         reel_width = 1080
@@ -194,73 +324,22 @@ class ConfessionImageGenerator:
         padding_x = int(reel_width * padding_percent)  # 108 pixels on each side
         available_width = reel_width - (2 * padding_x)  # 864 pixels available for text
         
-        # Create background
-        img = Image.new('RGB', (reel_width, reel_height), color=colors['bg'])
-        draw = ImageDraw.Draw(img)
-        
-        # Wrap text based on actual pixel width with padding
-        def wrap_text_by_width(text, font, max_width):
-            """Wrap text to fit within max_width pixels"""
-            words = text.split()
-            lines = []
-            current_line = []
-            
-            for word in words:
-                # Test if adding this word would exceed the width
-                test_line = ' '.join(current_line + [word])
-                bbox = draw.textbbox((0, 0), test_line, font=font)
-                test_width = bbox[2] - bbox[0]
-                
-                if test_width <= max_width:
-                    current_line.append(word)
-                else:
-                    if current_line:
-                        lines.append(' '.join(current_line))
-                    # Check if single word is too long
-                    word_bbox = draw.textbbox((0, 0), word, font=font)
-                    word_width = word_bbox[2] - word_bbox[0]
-                    if word_width > max_width:
-                        # Word is too long, need to break it
-                        chars = list(word)
-                        temp_word = ""
-                        for char in chars:
-                            test_char = temp_word + char
-                            char_bbox = draw.textbbox((0, 0), test_char, font=font)
-                            char_width = char_bbox[2] - char_bbox[0]
-                            if char_width > max_width and temp_word:
-                                lines.append(temp_word)
-                                temp_word = char
-                            else:
-                                temp_word += char
-                        if temp_word:
-                            current_line = [temp_word]
-                        else:
-                            current_line = []
-                    else:
-                        current_line = [word]
-            
-            if current_line:
-                lines.append(' '.join(current_line))
-            
-            return lines
+        # Create background, single channel when the scheme is all grays
+        colors = _grayscale_scheme(colors)
+        img, draw = self.create_solid_background(colors, (reel_width, reel_height))
         
         # Wrap text to fit within available width
-        lines = wrap_text_by_width(text, font_reel_large, available_width)
+        lines = _wrap_pixels(text, font_reel_large, available_width)
         
         # Calculate text positioning
         line_height = 85  # Larger line height for reel
         total_text_height = len(lines) * line_height
         start_y = (reel_height - total_text_height) // 2
         
-        # Draw text with padding
-        for i, line in enumerate(lines):
-            # Calculate x position for center alignment within padded area
-            text_bbox = draw.textbbox((0, 0), line, font=font_reel_large)
-            text_width = text_bbox[2] - text_bbox[0]
-            x = padding_x + (available_width - text_width) // 2  # Center within padded area
-            y = start_y + (i * line_height)
-            
-            draw.text((x, y), line, font=font_reel_large, fill=colors['text'])
+        # Draw all lines centered within the padded area in one call
+        draw.multiline_text((padding_x + available_width // 2, start_y), '\n'.join(lines),
+                            font=font_reel_large, fill=colors['text'], anchor="ma",
+                            spacing=_line_spacing(font_reel_large, line_height), align="center")
         
         # Add watermark
         watermark = "IITK QUICK CONFESSIONS"
@@ -273,14 +352,14 @@ class ConfessionImageGenerator:
                 id_text, font=font_reel_medium, fill=colors['accent'], anchor="mm")
         
         # Save image
-        filename = f"confession_{self.confession.row_num}_reel.png"
+        filename = f"confession_{self.confession.row_num}_reel.{self.output_format}"
         image_path = os.path.join(IMAGE_OUTPUT_DIR, filename)
-        img.save(image_path, quality=95, optimize=True)
+        _save_image(img, image_path, self.output_format)
         
         return image_path
     
-    def generate_confession_images(self) -> list[str]:
-        """Generate single or carousel images based on text length"""
+    def generate_confession_images(self) -> list[bytes]:
+        """Generate single or carousel images based on text length, encoded in memory"""
         # Choose color scheme based on confession ID for consistency
         color_scheme = {
                         'bg': (0, 0, 0),
@@ -297,11 +376,9 @@ class ConfessionImageGenerator:
         
         print(f"Generating {len(slides)} slide(s) for confession {self.confession.row_num}")
         
-        image_paths = []
-        for i, slide_text in enumerate(slides, 1):
-            image_path = self.create_slide_image(
-                slide_text, i, len(slides), color_scheme
-            )
-            image_paths.append(image_path)
-        
-        return image_paths
+        # Slides take tens of milliseconds each and the caller already overlaps rendering with
+        # network waits, so they are rendered in order on this thread
+        return [
+            self.create_slide_image(slide_text, i, len(slides), color_scheme)
+            for i, slide_text in enumerate(slides, 1)
+        ]
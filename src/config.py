@@ -0,0 +1,42 @@
+import functools
+import os
+from dataclasses import dataclass
+from typing import List, Optional
+
+# Env field -> environment variable it is read from
+ENV_VARS = {
+    "google_api_key": "GOOGLE_API_KEY",
+    "sheet_url": "GOOGLE_SHEET_URL",
+    "sheets_credentials_b64": "GOOGLE_SHEETS_CREDENTIALS_FILE",
+    "instagram_page_id": "INSTAGRAM_PAGE_ID",
+    "cloudinary_cloud_name": "CLOUDINARY_CLOUD_NAME",
+    "cloudinary_api_key": "CLOUDINARY_API_KEY",
+    "cloudinary_api_secret": "CLOUDINARY_API_SECRET",
+}
+
+@dataclass(frozen=True)
+class Env:
+    """Credentials and IDs the automation needs, read from the environment once per run."""
+    google_api_key: Optional[str]
+    sheet_url: Optional[str]
+    sheets_credentials_b64: Optional[str]
+    instagram_page_id: Optional[str]
+    cloudinary_cloud_name: Optional[str]
+    cloudinary_api_key: Optional[str]
+    cloudinary_api_secret: Optional[str]
+    max_confession_per_run: int
+
+    def missing(self) -> List[str]:
+        """Environment variables that were not set."""
+        return [var for name, var in ENV_VARS.items() if not getattr(self, name)]
+
+@functools.cache
+def get_env() -> Env:
+    """
+    Snapshot of the environment, taken on first use so a .env loaded in __main__ is seen.
+    The Instagram access token is not included; it is refreshed and replaced during a run.
+    """
+    return Env(
+        **{name: os.getenv(var) for name, var in ENV_VARS.items()},
+        max_confession_per_run=int(os.getenv("MAX_CONFESSION_PER_RUN") or 4),
+    )
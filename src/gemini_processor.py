@@ -1,106 +1,363 @@
+import asyncio
+import functools
+import importlib.util
+import io
+import json
+import re
+from string import Template
+import textwrap
+import time
+import httpx
+from pydantic import TypeAdapter, ValidationError
+from contextlib import aclosing
 from google import genai
-from google.genai.types import GenerateContentConfig, SafetySetting, HarmCategory, HarmBlockThreshold
+from google.genai.types import GenerateContentConfig, HttpOptions, HttpRetryOptions, SafetySetting, HarmCategory, HarmBlockThreshold
 import os
-from model import Confession, ConfessionSelectionResponse, ModerationResponse
-from typing import List
+from model import BulkProcessingResponse, Confession, ConfessionSelectionResponse, IndexedModerationResponse, ModerationResponse
+from moderation_cache import ModerationCache
+from config import get_env
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+# Upper bound on Gemini requests in flight at once from a single batch.
+GEMINI_CONCURRENCY = 50
+
+MODERATION_BATCH_SIZE = 100
+MODERATION_BATCH_TOKENS = 20000
+
+# With MODERATION_LITE_MODEL set, only safe verdicts on confessions shorter than this are
+# taken from the lite model; everything else is escalated to MODERATION_MODEL.
+LITE_MODERATION_MAX_CHARS = 300
+
+# With MODERATION_EMBEDDING_MODEL set, a confession whose embedding is at least this similar to a
+# previously rejected one reuses that rejection. Safe verdicts are never reused this way, because
+# their caption describes a different confession.
+SEMANTIC_CACHE_THRESHOLD = 0.9
+EMBEDDING_BATCH_SIZE = 100
+
+# Selection input limits: texts are truncated, near-duplicates dropped, and queues larger than
+# the threshold are shortlisted chunk by chunk before the final pick.
+SELECTION_TEXT_LIMIT = 800
+NEAR_DUPLICATE_THRESHOLD = 0.85
+SELECTION_MAP_THRESHOLD = 40
+SELECTION_CHUNK_SIZE = 20
+
+# Per-request prompts; only these vary between calls.
+MODERATION_BATCH_PROMPT = Template("""
+Moderate each of the following $count confessions independently.
+Return a JSON array with one object per confession, with "index" set to the confession's number.
+
+$numbered
+""")
+
+SELECTION_PROMPT = Template("""
+Review the following confessions, each given as a short summary with its sentiment:
+
+$confessions_text
+
+Select up to $max_count confessions that best fit the criteria.
+""")
+
+BULK_PROMPT = Template("""
+Moderate each of the following $count confessions, then select up to $max_count of the safe ones that best fit the criteria.
+
+$numbered
+""")
+
+MODERATION_ADAPTER = TypeAdapter(ModerationResponse)
+INDEXED_MODERATION_ADAPTER = TypeAdapter(IndexedModerationResponse)
+
+# Returned (and not cached) when Gemini gives no usable verdict, e.g. the response was blocked,
+# so a confession is never posted on the strength of a partial or missing answer.
+UNPARSED_MODERATION = ModerationResponse(
+    is_safe=False,
+    rejection_reason="No structured verdict returned (response blocked or malformed)",
+    sentiment="",
+    summary_caption="",
+)
+
+# Transient Gemini failures (rate limiting, overload, 5xx) are retried by the SDK with
+# exponential backoff and jitter instead of aborting the whole run.
+GEMINI_RETRY_OPTIONS = HttpRetryOptions(
+    attempts=5,
+    initial_delay=1.0,
+    max_delay=30.0,
+    http_status_codes=[408, 429, 500, 502, 503, 504],
+)
+
+# Matched against the partially streamed moderation JSON to stop early on a rejection.
+IS_UNSAFE_PATTERN = re.compile(r'"is_safe"\s*:\s*false')
+REJECTION_REASON_PATTERN = re.compile(r'"rejection_reason"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+# Concurrent async requests share multiplexed connections when the optional h2 package
+# is installed (pip install "httpx[http2]"); otherwise httpx falls back to HTTP/1.1.
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+ASYNC_CLIENT_LIMITS = httpx.Limits(max_keepalive_connections=64, max_connections=128)
+
+# Static instructions are sent as the system instruction so every request shares
+# the same prefix and only the confession text varies (eligible for implicit caching).
+MODERATION_SYSTEM = """
+Check the user's confession for hate speech, harassment, sexual content and dangerous content.
+Safe unless there is a major violation; give a brief rejection reason only if unsafe.
+Give its overall sentiment and an Instagram caption summarising it (max 50 words) with some hashtags.
+"""
+
+SELECTION_SYSTEM = """
+You curate confessions for the IIT Kanpur confessions Instagram page. From the numbered confessions given by the user, select up to the requested count that will engage IITK students best.
+
+Criteria:
+1. Original and creative. No near-duplicates of each other, no AI-written text, no shallow posts, no career/academic queries, no cliché love/proposal confessions unless the story is exceptional.
+2. IITK-specific: hostels/halls, profs, courses, exams, placements, fests, clubs, inter-hall events, campus places and infrastructure, inside jokes, campus social and dating life.
+3. Engaging: funny or emotionally strong, relatable, likely to spark discussion.
+4. Appropriate: humorous or constructive criticism of the institute, profs or clubs is fine; no hate speech, harassment, personal attacks or sexual content.
+5. Diverse: mix funny, serious and relatable tones and topics.
+
+As a witty "sigma" senior IITK admin, optionally write a reply for each selected confession, only if it is exceptionally clever; otherwise use "".
+
+"indices": 1-based confession numbers. "admin_replies": one entry per index, in the same order.
+"""
+
+# Moderation and selection in a single request: every confession gets a verdict, then the
+# top picks are chosen among the safe ones.
+BULK_SYSTEM = MODERATION_SYSTEM + """
+Do this for every confession the user lists, setting "index" to the confession's number.
+Then, considering only the confessions you marked safe, make the selection below.
+""" + SELECTION_SYSTEM
+
+@functools.cache
+def get_client(api_key: str) -> genai.Client:
+    """Returns the shared Gemini client for api_key, so its connection pool is reused across processors."""
+    return genai.Client(
+        api_key=api_key,
+        http_options=HttpOptions(
+            async_client_args={"http2": HTTP2_AVAILABLE, "limits": ASYNC_CLIENT_LIMITS},
+            retry_options=GEMINI_RETRY_OPTIONS,
+        ),
+    )
+
+class JSONArrayItemParser:
+    """Incrementally parses a streamed top-level JSON array, returning each element once it is complete."""
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def feed(self, text: str) -> list:
+        self.buffer += text
+        items = []
+        while True:
+            # Skip the opening bracket, separators and whitespace between elements.
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in "[, \t\r\n":
+                self.pos += 1
+            if self.pos >= len(self.buffer) or self.buffer[self.pos] == "]":
+                return items
+            try:
+                item, self.pos = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                return items  # The element is still incomplete; wait for more text.
+            items.append(item)
+
+class AsyncRateLimiter:
+    """Spaces out request starts to stay under a requests-per-minute quota; 0 disables it."""
+
+    def __init__(self, requests_per_minute: int):
+        self.interval = 60 / requests_per_minute if requests_per_minute > 0 else 0
+        self._next_slot = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        # Reserve the next slot before sleeping so concurrent callers queue up behind each other.
+        start = max(now, self._next_slot)
+        self._next_slot = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+def _shingles(text: str, size: int = 5) -> set:
+    """Character shingles of the whitespace-normalised, lower-cased text."""
+    text = " ".join(text.lower().split())
+    return {text[i:i + size] for i in range(max(len(text) - size + 1, 1))}
+
+def drop_near_duplicates(confessions: List[Confession], threshold: float = NEAR_DUPLICATE_THRESHOLD) -> List[Confession]:
+    """Keeps the first of any confessions whose shingle Jaccard similarity exceeds threshold."""
+    kept, kept_shingles = [], []
+    for conf in confessions:
+        shingles = _shingles(conf.text)
+        if any(len(shingles & other) / len(shingles | other) > threshold for other in kept_shingles):
+            print(f"Dropping near-duplicate confession ID: {conf.timestamp}")
+            continue
+        kept.append(conf)
+        kept_shingles.append(shingles)
+    return kept
 
 class GeminiProcessor:
+    # Bump whenever the moderation prompt changes so cached verdicts are invalidated.
+    template_version = "mod-v4"
+
     def __init__(self):
         """Initialize the Gemini API client."""
-        self.api_key = os.getenv("GOOGLE_API_KEY")
+        self.api_key = get_env().google_api_key
         if not self.api_key:
             raise ValueError("GOOGLE_API_KEY environment variable not set.")
-        self.client = genai.Client(api_key=self.api_key)
+        self.client = get_client(self.api_key)
+        self.cache = ModerationCache()
+        self._limiter = AsyncRateLimiter(int(os.getenv("GEMINI_RPM", "0")))
 
-    def select_top_confessions(self, confessions: List[Confession], max_count=4) -> List[Confession]:
-        """
-        Uses Gemini to select the top confessions based on creativity and potential reach.
-        Returns a list of the selected confessions.
-        """
-        # Prepare the prompt with all confessions
-        confessions_text = "\n\n".join([
-            f"Confession {i+1}:\n{conf.text}\nSentiment: {conf.sentiment}"
-            for i, conf in enumerate(confessions)
-        ])
+        # Configs and model names are fixed for the lifetime of the processor, so build them once.
+        self._moderation_model = os.getenv("MODERATION_MODEL")
+        self._moderation_lite_model = os.getenv("MODERATION_LITE_MODEL")
+        self._embedding_model = os.getenv("MODERATION_EMBEDDING_MODEL")
+        self._selection_model = os.getenv("SHORTLISTING_MODEL")
+        self._moderation_config = self.build_moderation_config()
+        self._moderation_batch_config = self.build_moderation_config(list[IndexedModerationResponse])
+        self._bulk_config = self.build_moderation_config(BulkProcessingResponse)
+        self._bulk_config.system_instruction = BULK_SYSTEM
+        self._selection_config = GenerateContentConfig(
+            system_instruction=SELECTION_SYSTEM,
+            response_mime_type='application/json',
+            response_schema=ConfessionSelectionResponse,
+        )
 
-        prompt = f"""
-        You are an expert social media content curator for IIT Kanpur. Your task is to select the most engaging confessions from the list below that will resonate deeply with the IITK student body and suitable for public sharing within the IITK community.
+    def _cache_key(self, confession_text: str) -> str:
+        # Verdicts from a tiered run depend on both models, so the lite model is part of the key.
+        model = "+".join(filter(None, [self._moderation_model, self._moderation_lite_model]))
+        return ModerationCache.make_key(model, self.template_version, confession_text)
 
-        **Selection criteria:**
-        * Creativity and originality: Consider the following aspects:
-            * **The confession should be **unique, creative, and original**. 
-            * **Avoid selecting multiple confessions that are too similar or repetitive. 
-            * **Avoid selecting cliche proposal and love confessions, select only if it narrates a good story and is highly creative.
-            * **Avoid confession seeking career advises or academic doubts which can be asked in other forums.
-            * **Avoid selection of confessions that lack depth.
-            * **Avoid confessions that seems to written with the help of AI.
-        * **IITK Relevance & Resonance:** The confession should deeply connect with **IITK student life**. Look for content that highlights:
-            * **Campus-specific experiences** (e.g., convocation, yearbooks, fests, specific campus locations).
-            * **Struggles or triumphs** related to courses, professors, exams, placements, college fests, clubs, inter-hall competitions, or other unique aspects of IITK life.
-            * **Inside jokes** or common student observations unique to IITK.
-            * **Hostel life**, residential hall experiences, or campus infrastructure issues.
-            * **Observations on campus social dynamics**, dating culture, or interpersonal relationships within the IITK context
-        * **Engagement Potential:** The best confessions will naturally spark **discussion, foster relatability, or have the potential to go viral**. Consider if the confession is:
-            * **Humorous or emotionally impactful.**
-            * Likely to prompt a wide range of responses (agreement, debate, shared experiences).
-        * **Tone & Appropriateness:** Ensure the confession adheres to community guidelines. It's okay to include **constructive or humorous criticism** of the institute, professors, or student bodies/clubs. However, **strictly avoid** any content that involves hate speech, harassment, personal attacks, or sexually explicit material.
-        * **Diversity in Content:** Aim for a good mix of confessions that offer **diverse tones and topics**. This includes a balance of funny, serious, and deeply relatable submissions to keep the confession page dynamic and appealing to a broad audience.
+    def _bulk_cache_key(self, confession_text: str) -> str:
+        # Fused verdicts come from the selection model with the bulk prompt, so they are stored under their own key.
+        return ModerationCache.make_key(self._selection_model, f"{self.template_version}-bulk", confession_text)
 
+    def _cached_verdict(self, confession_text: str) -> Optional[ModerationResponse]:
+        """A stored verdict for the text: the moderation model's if there is one, else the fused request's."""
+        cached = self.cache.get(self._cache_key(confession_text))
+        if cached is None:
+            cached = self.cache.get(self._bulk_cache_key(confession_text))
+        return cached
 
-        Review the following confessions:
+    async def select_top_confessions_async(self, confessions: List[Confession], max_count=4,
+                                           concurrency: int = GEMINI_CONCURRENCY) -> List[Confession]:
+        """
+        Uses Gemini to select the top confessions based on creativity and potential reach.
+        Returns a list of the selected confessions.
+        Must be awaited on the same event loop as the run's other Gemini calls: the shared client's
+        async connection pool is bound to the first loop that uses it.
+        Near-duplicates are dropped first; large queues are shortlisted in concurrent chunks
+        and the final pick is made among the chunk finalists.
+        """
+        confessions = drop_near_duplicates(confessions)
+        semaphore = asyncio.Semaphore(concurrency)
 
-        {confessions_text}
+        if len(confessions) > SELECTION_MAP_THRESHOLD:
+            chunks = [confessions[i:i + SELECTION_CHUNK_SIZE] for i in range(0, len(confessions), SELECTION_CHUNK_SIZE)]
+            finalists = await asyncio.gather(*[self._select_from(chunk, max_count, semaphore) for chunk in chunks])
+            confessions = [conf for chunk_finalists in finalists for conf in chunk_finalists]
 
-        Select up to {max_count} confessions that best fit the criteria above. 
+        return await self._select_from(confessions, max_count, semaphore)
 
-        Act as a charismatic, sigma senior admin of IITK with a deep understanding of campus culture. Optionally, include a list of witty, sigma-style admin replies for the selected confessions, but only if the replies are exceptionally clever and resonate with IITK vibes—otherwise, leave the replies field empty. 
+    async def _select_from(self, confessions: List[Confession], max_count: int,
+                           semaphore: asyncio.Semaphore) -> List[Confession]:
+        """Asks Gemini for up to max_count confessions out of one list."""
+        async with semaphore:
+            await self._limiter.wait()
+            response = await self.client.aio.models.generate_content(
+                model=self._selection_model,
+                contents=self.build_selection_prompt(confessions, max_count),
+                config=self._selection_config
+            )
+        return self._apply_selection(confessions, response.parsed, max_count)
 
-        Return your response as a JSON object with two fields:
-        - "indices": A JSON array of the 1-based indices of the selected confessions, e.g., [2, 5, 1, 4].
-        - "admin_replies": A JSON array of the same size as indices of admin replies (strings) corresponding to the selected confessions, keep the index empty string '' if no admin reply.
+    async def process_confessions_bulk_async(self, confessions: List[Confession], max_count=4) -> Optional[List[Confession]]:
         """
+        Moderates and selects confessions with a single Gemini request.
+        Safe confessions get their sentiment and caption filled in, and the selected ones are returned.
+        Returns None when the fused response is unusable (blocked, malformed, incomplete), the
+        queue is too large for one prompt, or some confessions already have cached verdicts, so callers
+        can fall back to moderate_batch + select_top_confessions_async on the same event loop.
+        moderate_batch then sends only the cache misses, through the lite and semantic tiers.
+        """
+        confessions = drop_near_duplicates(confessions)
+        if not confessions or len(confessions) > SELECTION_MAP_THRESHOLD:
+            return None
+        hits = sum(self._cached_verdict(conf.text) is not None for conf in confessions)
+        if hits:
+            print(f"{hits} of {len(confessions)} confessions have cached verdicts; moderating only the rest.")
+            return None
 
-        config = GenerateContentConfig(
-            response_mime_type='application/json',
-            response_schema=ConfessionSelectionResponse,
-        )
-        
-        response = self.client.models.generate_content(
-            model=os.getenv('SHORTLISTING_MODEL'),
-            contents=prompt,
-            config=config
+        numbered = "\n\n".join(f"Confession {i+1}:\n\"{conf.text}\"" for i, conf in enumerate(confessions))
+        await self._limiter.wait()
+        response = await self.client.aio.models.generate_content(
+            model=self._selection_model,
+            contents=BULK_PROMPT.substitute(count=len(confessions), max_count=max_count, numbered=numbered),
+            config=self._bulk_config
         )
 
-        result: ConfessionSelectionResponse = response.parsed
-        
-        selected_confessions = []
-        # Convert 1-based indices to 0-based and get selected confessions
-        for j , i in enumerate(result.indices):
-            confessions[i-1].sigma_reply = result.admin_replies[j] if i-1 < len(result.admin_replies) else ''
-            selected_confessions.append(confessions[i-1])
+        result: Optional[BulkProcessingResponse] = response.parsed
+        if result is None:
+            return None
+        verdicts = {item.index - 1: item for item in result.items if 1 <= item.index <= len(confessions)}
+        if len(verdicts) != len(confessions):
+            return None
 
-        return selected_confessions
+        for i, conf in enumerate(confessions):
+            verdict = ModerationResponse(
+                is_safe=verdicts[i].is_safe,
+                rejection_reason=verdicts[i].rejection_reason,
+                sentiment=verdicts[i].sentiment,
+                summary_caption=verdicts[i].summary_caption,
+            )
+            self.cache.set(self._bulk_cache_key(conf.text), verdict)
+            if verdict.is_safe:
+                conf.sentiment = verdict.sentiment
+                conf.summary_caption = verdict.summary_caption
+            else:
+                print(f"Confession ID {conf.timestamp} deemed UNSAFE: {verdict.rejection_reason}")
 
-    def moderate_and_shortlist_confession(self, confession_text: str) -> ModerationResponse:
+        # Never select a confession the same response judged unsafe.
+        replies = result.admin_replies + [''] * (len(result.indices) - len(result.admin_replies))
+        picks = [(i, reply) for i, reply in zip(result.indices, replies) if i - 1 in verdicts and verdicts[i - 1].is_safe]
+        selection = ConfessionSelectionResponse(
+            indices=[i for i, _ in picks],
+            admin_replies=[reply for _, reply in picks],
+        )
+        return self._apply_selection(confessions, selection, max_count)
+
+    def build_selection_prompt(self, confessions: List[Confession], max_count: int) -> str:
         """
-        Uses Gemini 1.5 Flash to moderate for hate speech and determine suitability.
-        Returns a ModerationResponse dataclass with is_safe, rejection_reason, sentiment, and summary_caption.
+        Lists the confessions for the selection request, one line each.
+        Moderated confessions are represented by their summary caption, which is far shorter than
+        the text; any without one fall back to the text truncated to SELECTION_TEXT_LIMIT characters.
         """
-        prompt = f"""
-        Analyze the following confession text for hate speech, harassment, sexually explicit content, and dangerous content.
-        Also, determine its overall sentiment (Positive, Negative, Neutral, Mixed) and provide a concise summary (max 50 words) suitable for an Instagram caption along with some hashtags.
+        buffer = io.StringIO()
+        for i, conf in enumerate(confessions, 1):
+            text = conf.summary_caption or textwrap.shorten(conf.text, SELECTION_TEXT_LIMIT, placeholder='...')
+            buffer.write(f"{i}: {text} [{conf.sentiment}]\n")
 
-        Confession Text:
-        "{confession_text}"
+        return SELECTION_PROMPT.substitute(confessions_text=buffer.getvalue().rstrip("\n"), max_count=max_count)
 
-        Output a JSON object with the following keys:
-        - "is_safe": boolean (true if no major safety violations, false otherwise)
-        - "rejection_reason": string (brief reason if not safe, empty string if safe)
-        - "sentiment": string (Positive, Negative, Neutral, Mixed)
-        - "summary_caption": string (concise summary suitable for Instagram along with some hashtags, max 50 words)
-        """
+    @staticmethod
+    def _apply_selection(confessions: List[Confession], result: Optional[ConfessionSelectionResponse], max_count: int) -> List[Confession]:
+        if result is None:
+            return []
 
-        config = GenerateContentConfig(
+        # The model returns 1-based indices; drop hallucinated out-of-range or repeated ones
+        # and pair each remaining index with its reply (missing replies become '').
+        replies = result.admin_replies + [''] * (len(result.indices) - len(result.admin_replies))
+        selected_confessions = []
+        seen = set()
+        for i, reply in zip(result.indices, replies):
+            if not 1 <= i <= len(confessions) or i in seen:
+                continue
+            seen.add(i)
+            confessions[i-1].sigma_reply = reply
+            selected_confessions.append(confessions[i-1])
+
+        return selected_confessions[:max_count]
+
+    def build_moderation_config(self, response_schema=ModerationResponse) -> GenerateContentConfig:
+        """Builds the moderation generation config; pass list[IndexedModerationResponse] for batched requests."""
+        return GenerateContentConfig(
+            system_instruction=MODERATION_SYSTEM,
             safety_settings=[
                 SafetySetting(
                     category=HarmCategory.HARM_CATEGORY_HARASSMENT,
@@ -120,19 +377,236 @@ class GeminiProcessor:
                 ),
             ],
             response_mime_type='application/json',
-            response_schema=ModerationResponse,
+            response_schema=response_schema,
         )
+
+    def build_moderation_request(self, confession_text: str) -> tuple[str, GenerateContentConfig]:
+        """Builds the moderation prompt and generation config for a single confession."""
+        # The instructions live in the system instruction, so the request is just the confession.
+        return confession_text, self._moderation_config
+
+    def moderate_and_shortlist_confession(self, confession_text: str) -> ModerationResponse:
+        """
+        Uses Gemini to moderate for hate speech and determine suitability.
+        Returns a ModerationResponse dataclass with is_safe, rejection_reason, sentiment, and summary_caption.
+        Responses without a parsable verdict are treated as unsafe.
+        """
+        key = self._cache_key(confession_text)
+        cached = self._cached_verdict(confession_text)
+        if cached is not None:
+            return cached
+
+        prompt, config = self.build_moderation_request(confession_text)
         
         response = self.client.models.generate_content(
-            model=os.getenv("MODERATION_MODEL"),
+            model=self._moderation_model,
             contents=prompt,
             config=config
         )
         
-        result: ModerationResponse = response.parsed
-        
+        result: Optional[ModerationResponse] = response.parsed
+        if result is None:
+            return UNPARSED_MODERATION
+
+        self.cache.set(key, result)
         return result
 
+    async def _moderate_one(self, confession_text: str, model: str) -> ModerationResponse:
+        """
+        Async variant of moderate_and_shortlist_confession using the aio client.
+        The response is streamed and abandoned as soon as the confession is rejected,
+        since the sentiment and caption of a rejected confession are never used.
+        """
+        prompt, config = self.build_moderation_request(confession_text)
+
+        buffer = ""
+        result: Optional[ModerationResponse] = None
+        await self._limiter.wait()
+        stream = await self.client.aio.models.generate_content_stream(
+            model=model,
+            contents=prompt,
+            config=config
+        )
+        async with aclosing(stream):
+            async for chunk in stream:
+                buffer += chunk.text or ""
+                if IS_UNSAFE_PATTERN.search(buffer):
+                    reason = REJECTION_REASON_PATTERN.search(buffer)
+                    if reason:
+                        result = ModerationResponse(
+                            is_safe=False,
+                            rejection_reason=json.loads(f'"{reason.group(1)}"'),
+                            sentiment="",
+                            summary_caption="",
+                        )
+                        break
+
+        if result is None:
+            try:
+                result = MODERATION_ADAPTER.validate_json(buffer)
+            except ValidationError:
+                return UNPARSED_MODERATION
+
+        return result
+
+    @staticmethod
+    def _pack_batches(confession_texts: List[str], indices: List[int]) -> List[List[int]]:
+        """Greedily packs indices into groups of at most MODERATION_BATCH_SIZE within the token budget."""
+        batches, current, current_tokens = [], [], 0
+        for i in indices:
+            # Rough estimate of ~4 characters per token, plus a little framing per item.
+            tokens = len(confession_texts[i]) // 4 + 10
+            if current and (len(current) == MODERATION_BATCH_SIZE or current_tokens + tokens > MODERATION_BATCH_TOKENS):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def moderate_stream(self, confession_texts: List[str], model: Optional[str] = None) -> AsyncIterator[Tuple[int, ModerationResponse]]:
+        """
+        Moderates several confessions in a single streamed request, yielding (0-based position, verdict)
+        pairs as soon as each array element has fully arrived, so callers can act on early items
+        while later ones are still being generated.
+        Confessions the response does not cover (blocked, malformed or skipped by the model) are never yielded.
+        Usage: async for position, verdict in processor.moderate_stream(texts): ...
+        """
+        numbered = "\n\n".join(f"Confession {i+1}:\n\"{text}\"" for i, text in enumerate(confession_texts))
+        prompt = MODERATION_BATCH_PROMPT.substitute(count=len(confession_texts), numbered=numbered)
+
+        await self._limiter.wait()
+        stream = await self.client.aio.models.generate_content_stream(
+            model=model or self._moderation_model,
+            contents=prompt,
+            config=self._moderation_batch_config
+        )
+
+        parser = JSONArrayItemParser()
+        seen = set()
+        async with aclosing(stream):
+            async for chunk in stream:
+                for obj in parser.feed(chunk.text or ""):
+                    try:
+                        item = INDEXED_MODERATION_ADAPTER.validate_python(obj)
+                    except ValidationError:
+                        continue
+                    # Items carry the 1-based number of the confession they judge, so order does not matter.
+                    if 1 <= item.index <= len(confession_texts) and item.index - 1 not in seen:
+                        seen.add(item.index - 1)
+                        yield item.index - 1, ModerationResponse(
+                            is_safe=item.is_safe,
+                            rejection_reason=item.rejection_reason,
+                            sentiment=item.sentiment,
+                            summary_caption=item.summary_caption,
+                        )
+
+    async def _moderate_indices(self, confession_texts: List[str], indices: List[int], model: str,
+                                results: List[Optional[ModerationResponse]], semaphore: asyncio.Semaphore,
+                                checkpoint: bool = True):
+        """
+        Moderates confession_texts[i] for each i in indices with `model`, writing verdicts into results.
+        With checkpoint set, each verdict is saved to the cache as soon as it arrives, so a run that
+        crashes or exhausts its retries resumes from there instead of re-moderating everything.
+        """
+        def record(i: int, verdict: ModerationResponse):
+            results[i] = verdict
+            if checkpoint and verdict is not UNPARSED_MODERATION:
+                self.cache.set(self._cache_key(confession_texts[i]), verdict)
+
+        async def bounded(i: int):
+            async with semaphore:
+                verdict = await self._moderate_one(confession_texts[i], model)
+            record(i, verdict)
+
+        async def run_batch(batch: List[int]):
+            if len(batch) > 1:
+                done = set()
+                async with semaphore:
+                    async for position, verdict in self.moderate_stream([confession_texts[i] for i in batch], model):
+                        record(batch[position], verdict)
+                        done.add(position)
+                # A blocked or malformed response loses some or all verdicts; retry those confessions alone.
+                batch = [i for position, i in enumerate(batch) if position not in done]
+                if batch:
+                    print(f"{len(batch)} confessions missing from batched moderation, retrying individually.")
+            await asyncio.gather(*[bounded(i) for i in batch])
+
+        await asyncio.gather(*[run_batch(batch) for batch in self._pack_batches(confession_texts, indices)])
+
+    async def moderate_batch(self, confession_texts: List[str], concurrency: int = GEMINI_CONCURRENCY) -> List[ModerationResponse]:
+        """
+        Moderates many confessions, packing up to MODERATION_BATCH_SIZE of them into each request
+        and keeping at most `concurrency` requests in flight.
+        If MODERATION_LITE_MODEL is set, every confession goes to it first and only short,
+        safe verdicts are kept; rejections and longer confessions are re-checked by MODERATION_MODEL.
+        If MODERATION_EMBEDDING_MODEL is set, confessions semantically close to a previously
+        rejected one are rejected from the cache without a moderation call.
+        Results are returned in the same order as the input texts.
+        Usage: asyncio.run(processor.moderate_batch(texts))
+        """
+        results: List[Optional[ModerationResponse]] = [None] * len(confession_texts)
+        pending = []
+        for i, text in enumerate(confession_texts):
+            cached = self._cached_verdict(text)
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append(i)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        vectors: Dict[int, List[float]] = {}
+        if self._embedding_model and pending:
+            vectors = await self._embed(confession_texts, pending, semaphore)
+            for i, vector in vectors.items():
+                similar = self.cache.similar_rejection(vector, SEMANTIC_CACHE_THRESHOLD)
+                if similar is not None:
+                    print(f"Confession matches a previously rejected one: {similar.rejection_reason}")
+                    results[i] = similar
+                    self.cache.set(self._cache_key(confession_texts[i]), similar)
+            pending = [i for i in pending if results[i] is None]
+
+        if self._moderation_lite_model and pending:
+            # Lite verdicts are only final once we know they will not be escalated.
+            await self._moderate_indices(confession_texts, pending, self._moderation_lite_model, results, semaphore,
+                                         checkpoint=False)
+            escalated = [
+                i for i in pending
+                if not results[i].is_safe or len(confession_texts[i]) >= LITE_MODERATION_MAX_CHARS
+            ]
+            for i in set(pending) - set(escalated):
+                if results[i] is not UNPARSED_MODERATION:
+                    self.cache.set(self._cache_key(confession_texts[i]), results[i])
+            print(f"Escalating {len(escalated)} of {len(pending)} confessions to {self._moderation_model}.")
+        else:
+            escalated = pending
+        await self._moderate_indices(confession_texts, escalated, self._moderation_model, results, semaphore)
+
+        for i in pending:
+            if i in vectors and not results[i].is_safe and results[i] is not UNPARSED_MODERATION:
+                self.cache.add_rejected_embedding(self._cache_key(confession_texts[i]), vectors[i])
+        return results
+
+    async def _embed(self, confession_texts: List[str], indices: List[int],
+                     semaphore: asyncio.Semaphore) -> Dict[int, List[float]]:
+        """Embeds confession_texts[i] for each i in indices, EMBEDDING_BATCH_SIZE texts per request."""
+        async def embed_chunk(chunk: List[int]) -> Dict[int, List[float]]:
+            async with semaphore:
+                await self._limiter.wait()
+                response = await self.client.aio.models.embed_content(
+                    model=self._embedding_model,
+                    contents=[confession_texts[i] for i in chunk],
+                )
+            return {i: embedding.values for i, embedding in zip(chunk, response.embeddings or []) if embedding.values}
+
+        chunks = [indices[k:k + EMBEDDING_BATCH_SIZE] for k in range(0, len(indices), EMBEDDING_BATCH_SIZE)]
+        vectors = {}
+        for chunk_vectors in await asyncio.gather(*[embed_chunk(chunk) for chunk in chunks]):
+            vectors.update(chunk_vectors)
+        return vectors
+
 if __name__ == "__main__":
     from dotenv import load_dotenv
     load_dotenv()
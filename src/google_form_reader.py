@@ -1,40 +1,94 @@
 import os
+import atexit
 import gspread
 import base64 
-from typing import List
+import json
+import time
+from dataclasses import asdict
+from typing import Dict, List, Optional, Tuple
+from gspread.utils import rowcol_to_a1
 from model import Confession
+from config import get_env
 
 # You'll need to share your Google Sheet with the service account email.
 
+# Column C holds each confession's status (1 posted, 0 rejected or failed, empty if unprocessed).
+# The layout is fixed by this project, so the header row is never read to find it.
+STATUS_COL = 3
+
+# Rows fetched from the bottom of the sheet when looking for new confessions; doubled until
+# a processed row is found.
+TAIL_WINDOW = 50
+
+# Worksheet handles keyed by sheet URL, so the spreadsheet metadata is fetched once per process.
+_ws_cache: Dict[str, gspread.Worksheet] = {}
+
+# New confessions from the last read, reused while the sheet's Drive modifiedTime is unchanged.
+# Used unless SHEET_CACHE_PATH is set.
+DEFAULT_SHEET_CACHE_PATH = ".sheet_cache.json"
+
+# Seconds the Instagram access token read from the sheet is reused before it is read again.
+IG_TOKEN_TTL = 3000
+
+class SheetsBackOffHTTPClient(gspread.BackOffHTTPClient):
+    """
+    Retries rate-limited (429), timed out (408) and 5xx Sheets requests with exponential backoff,
+    so a transient quota error does not abort the run. gspread's own loop never gives up, so this
+    stops after _MAX_ATTEMPTS (about 30s of waiting) and re-raises, letting an outage fail the run.
+    """
+    _MAX_BACKOFF = 32
+    _MAX_ATTEMPTS = 5
+
+    def _is_retryable(self, error: gspread.exceptions.APIError) -> bool:
+        # Drive reports quota errors as 403 with a usageLimits domain
+        errors = error.error.get("errors") if isinstance(error.error, dict) else None
+        if error.code == 403 and errors and errors[0].get("domain") == "usageLimits":
+            return True
+        return error.code in self._HTTP_ERROR_CODES or error.code >= 500
+
+    def request(self, *args, **kwargs):
+        for attempt in range(1, self._MAX_ATTEMPTS + 1):
+            try:
+                return gspread.HTTPClient.request(self, *args, **kwargs)
+            except gspread.exceptions.APIError as e:
+                if attempt == self._MAX_ATTEMPTS or not self._is_retryable(e):
+                    raise
+                time.sleep(min(2 ** attempt, self._MAX_BACKOFF))
+
 class GoogleFormReader:
     def __init__(self, sheet_url, credentials_path=None):
         """
         Initialize the Google Form Reader with sheet URL and optional credentials path.
-        If credentials_path is not provided, it will try to decode from environment variable.
+        If credentials_path is not provided, the base64-encoded service account JSON in the
+        GOOGLE_SHEETS_CREDENTIALS_FILE environment variable is decoded in memory.
         """
         self.sheet_url = sheet_url
         self.client = None
+        # Read here rather than at import, so a .env loaded in __main__ is seen
+        self.sheet_cache_path = os.getenv("SHEET_CACHE_PATH", DEFAULT_SHEET_CACHE_PATH)
+        self._ig_token_cache: Optional[Tuple[str, float]] = None
+        # Confession count (D1) as last read alongside the token, or as last written
+        self._count: Optional[int] = None
+        # Status writes (and the new count) queued by queue_statuses, written by flush()
+        self._pending_statuses: List[Tuple[int, int]] = []
+        self._pending_count: Optional[int] = None
+        atexit.register(self.flush)
         self.credentials_path = credentials_path
         
-        if not self.credentials_path:
-            self.credentials_path = self.decode_credentials(
-                os.getenv("GOOGLE_SHEETS_CREDENTIALS_FILE"), 
-                "google_sheets_credentials.json"
+        if self.credentials_path:
+            self.client = self.get_sheets_client(self.credentials_path)
+        else:
+            # Build the client straight from the decoded secret; nothing is written to disk.
+            self.client = self.get_sheets_client_from_info(
+                self.decode_credentials(get_env().sheets_credentials_b64)
             )
-        
-        self.client = self.get_sheets_client(self.credentials_path)
 
-    def decode_credentials(self, base64_string, filename="credentials.json"):
+    def decode_credentials(self, base64_string) -> dict:
         """
-        Decodes a base64 string into a file.
-        This file is created temporarily in the GitHub Actions runner.
+        Decodes a base64-encoded service account JSON into a dict.
         """
         try:
-            decoded_bytes = base64.b64decode(base64_string)
-            with open(filename, "wb") as f:
-                f.write(decoded_bytes)
-            print(f"Successfully decoded credentials to {filename}")
-            return filename
+            return json.loads(base64.b64decode(base64_string))
         except Exception as e:
             print(f"Error decoding credentials: {e}")
             raise # Re-raise the exception
@@ -43,12 +97,32 @@ class GoogleFormReader:
         """Authenticates and returns the gspread client using a service account."""
         try:
             # Load service account credentials from a JSON file
-            gc = gspread.service_account(filename=credentials_path)
+            gc = gspread.service_account(filename=credentials_path, http_client=SheetsBackOffHTTPClient)
             return gc
         except Exception as e:
             print(f"Error authenticating with Google Sheets service account: {e}")
             raise
 
+    def get_sheets_client_from_info(self, credentials_info: dict):
+        """Authenticates and returns the gspread client from in-memory service account info."""
+        try:
+            return gspread.service_account_from_dict(credentials_info, http_client=SheetsBackOffHTTPClient)
+        except Exception as e:
+            print(f"Error authenticating with Google Sheets service account: {e}")
+            raise
+
+    @property
+    def worksheet(self) -> gspread.Worksheet:
+        """The first worksheet of the sheet, opened once per process and shared by every reader."""
+        if self.sheet_url not in _ws_cache:
+            _ws_cache[self.sheet_url] = self.client.open_by_url(self.sheet_url).get_worksheet(0)
+        return _ws_cache[self.sheet_url]
+
+    def _forget_worksheet(self, error: Exception):
+        """Drops the cached worksheet after an API error so the next call resolves it again."""
+        if isinstance(error, gspread.exceptions.APIError):
+            _ws_cache.pop(self.sheet_url, None)
+
     def get_latest_confessions_from_sheet(self) -> List[Confession]:
         """
         Retrieves confessions from a Google Sheet, filtering out already processed ones.
@@ -59,31 +133,60 @@ class GoogleFormReader:
         - Rows are added to the bottom.
         """
         try:
-            spreadsheet = self.client.open_by_url(self.sheet_url)
-            worksheet = spreadsheet.get_worksheet(0) # Get the first worksheet
+            worksheet = self.worksheet # The first worksheet
 
-            # Get all records as a list of dictionaries (using header row as keys)
-            # Or as a list of lists if you prefer to access by index
-            all_records = worksheet.get_all_values()
-            total_rows = len(all_records)
+            # A metadata lookup is cheaper than a values read; skip the read if nothing changed
+            modified_time = self.get_modified_time(worksheet)
+            cached = self.load_sheet_cache()
+            if modified_time and cached.get("modified_time") == modified_time:
+                print("Google Sheet unchanged since the last read. Using cached confessions.")
+                return [Confession(**confession) for confession in cached["confessions"]]
 
-            if not all_records:
-                print("No data found in the Google Sheet.")
-                return []
+            confessions, processed_row = self.read_new_confessions(worksheet, cached.get("processed_row"))
+            if modified_time:
+                self.save_sheet_cache(modified_time, confessions, processed_row)
+            return confessions
+        
+        except Exception as e:
+            print(f"Error reading Google Sheet: {e}")
+            self._forget_worksheet(e)
+            return []
 
-            # Assuming the first row is headers, adjust if not
-            header_row = all_records[0]
-            data_rows = all_records[1:] # Skip header row
+    def read_new_confessions(self, worksheet: gspread.Worksheet, processed_row: Optional[int] = None
+                             ) -> Tuple[List[Confession], Optional[int]]:
+        """
+        Reads the unprocessed rows at the bottom of the worksheet, newest first, along with the
+        row of the processed confession they stop at (None if they reach the header).
+        processed_row is that row from the previous read: rows are only ever marked, never
+        unmarked, so the read can start there instead of growing a window to find it.
+        """
+        last_row = worksheet.row_count
+        window = TAIL_WINDOW
+        if processed_row and processed_row <= last_row:
+            window = last_row - processed_row + 1
 
-            filtered_confessions = []
-            for i, row in enumerate(reversed(data_rows)):
+        if last_row < 2:
+            print("No data found in the Google Sheet.")
+            return [], None
+
+        # Only the tail of the sheet can be unprocessed, so fetch the last `window` rows and
+        # widen the window until it reaches a processed row or the header.
+        while True:
+            start_row = max(2, last_row - window + 1) # Row 1 is the header
+            tail_rows = worksheet.get(f"A{start_row}:{rowcol_to_a1(last_row, STATUS_COL)}", maintain_size=True)
 
-                if row[2] != '':  # Stop if unprocessed
+            filtered_confessions = []
+            reached_processed = False
+            for i, row in enumerate(reversed(tail_rows)):
+                if not any(row):  # Blank grid rows below the last response
+                    continue
+                if row[STATUS_COL - 1] != '':  # Stop at the first processed row
+                    reached_processed = True
+                    processed_row = start_row + len(tail_rows) - 1 - i
                     break
-                # row.insert(0, total_rows - i)  # Append the row number for later reference
                 confession = Confession(
                     timestamp=row[0],  # Column A: timestamp
-                    row_num=total_rows - i,  # Row number (1-based index)
+                    row_num=start_row + len(tail_rows) - 1 - i,  # Row number (1-based index)
                     text=row[1],  # Column B: confession text
                     summary_caption=None,  # Optional fields, set to None for now
                     sentiment=None,
@@ -91,84 +194,137 @@ class GoogleFormReader:
                 )
                 filtered_confessions.append(confession)
 
-            return filtered_confessions
-        
+            if reached_processed:
+                return filtered_confessions, processed_row
+            if start_row == 2:
+                return filtered_confessions, None
+            window *= 2
+
+    def get_modified_time(self, worksheet: gspread.Worksheet) -> Optional[str]:
+        """The sheet's last modification time from the Drive API, or None if it can't be read."""
+        try:
+            return worksheet.spreadsheet.get_lastUpdateTime()
         except Exception as e:
-            print(f"Error reading Google Sheet: {e}")
-            return []
+            print(f"Error getting Google Sheet modification time: {e}")
+            return None
+
+    def load_sheet_cache(self) -> dict:
+        """The cached read for this sheet, or an empty dict."""
+        try:
+            with open(self.sheet_cache_path) as f:
+                return json.load(f).get(self.sheet_url, {})
+        except (OSError, ValueError):
+            return {}
+
+    def save_sheet_cache(self, modified_time: Optional[str], confessions: List[Confession], processed_row: Optional[int]):
+        """Stores the confessions read at modified_time for this sheet, and where the read stopped."""
+        try:
+            with open(self.sheet_cache_path, "w") as f:
+                json.dump({self.sheet_url: {
+                    "modified_time": modified_time,
+                    "confessions": [asdict(confession) for confession in confessions],
+                    "processed_row": processed_row,
+                }}, f)
+        except OSError as e:
+            print(f"Error writing sheet cache: {e}")
 
-    def mark_confession_as_processed(self, confession_row, status):
+    def expire_sheet_cache(self):
         """
-        Marks a confession as processed (e.g., by updating a column in the sheet).
-        Also adds the ID to the local processed_confessions.json.
+        Makes the next read go to the sheet after statuses are written. Drive's modifiedTime lags
+        behind Sheets writes, so the cached confessions could otherwise be returned, and posted, again.
+        processed_row is kept: rows are only ever marked, so it still bounds the next read.
         """
+        cached = self.load_sheet_cache()
+        if cached:
+            self.save_sheet_cache(None, [], cached.get("processed_row"))
+
+    def mark_batch(self, rows: List[Tuple[int, int]], count: Optional[int] = None):
+        """
+        Writes (row, status) pairs to the status column, and the confession count (cell D1) when
+        given, in a single batch update.
+        """
+        if not rows and count is None:
+            return
         try:
-            spreadsheet = self.client.open_by_url(self.sheet_url)
-            worksheet = spreadsheet.get_worksheet(0)
-            
-            # Option 1: Write "PROCESSED" to a new column (e.g., column C, index 2)
-            # Ensure your sheet has this column or gspread will raise an error if out of bounds.
-            # You might need to add a "Status" header to your sheet.
-            status_col_index = 3 # Find 'Status' column or pick a fixed one
-                
-            worksheet.update_cell(confession_row, status_col_index, status)
-            print(f"Marked row {confession_row} as PROCESSED in Google Sheet.")
+            data = [
+                {"range": rowcol_to_a1(row, STATUS_COL), "values": [[status]]}
+                for row, status in rows
+            ]
+            if count is not None:
+                data.append({"range": rowcol_to_a1(1, 4), "values": [[count]]})
+            self.worksheet.batch_update(data)
+            if rows:
+                self.expire_sheet_cache()
+                print(f"Marked {len(rows)} rows as PROCESSED in Google Sheet.")
+            if count is not None:
+                self._count = count
+                print(f"Updated confession count to {count} in Google Sheet.")
 
         except Exception as e:
-            print(f"Error marking confession {confession_row} as processed: {e}")
+            print(f"Error marking rows {[row for row, _ in rows]} as processed: {e}")
+            self._forget_worksheet(e)
+
+    def queue_statuses(self, rows: List[Tuple[int, int]], count: Optional[int] = None):
+        """
+        Buffers (row, status) pairs, and the confession count when given, until flush().
+        """
+        self._pending_statuses.extend(rows)
+        if count is not None:
+            self._pending_count = count
+
+    def flush(self):
+        """
+        Writes everything queued with queue_statuses in one batch update.
+        Also runs at interpreter exit, so queued statuses survive a crash later in the run.
+        """
+        rows, count = self._pending_statuses, self._pending_count
+        self._pending_statuses, self._pending_count = [], None
+        self.mark_batch(rows, count)
 
     def get_count(self) -> int:
         """
-        Updates the confession count in the Google Sheet.
-        Assumes the count is stored in a specific cell (e.g., A1).
+        Returns the confession count stored in cell D1.
+        Reuses the value read with the Instagram token earlier in the run, if there is one.
         """
+        if self._count is not None:
+            return self._count
         try:
-            spreadsheet = self.client.open_by_url(self.sheet_url)
-            worksheet = spreadsheet.get_worksheet(0)
-            return int(worksheet.cell(1, 4).value)
+            self._count = int(self.worksheet.cell(1, 4).value)
+            return self._count
         
         except Exception as e:
             print(f"Error getting confession count: {e}")
+            self._forget_worksheet(e)
             return 0
         
-    def increment_count(self) -> None:
+    def get_instagram_access_token(self) -> str:
         """
-        Updates the confession count in the Google Sheet.
-        Assumes the count is stored in a specific cell (e.g., A1).
+        Fetches the Instagram access token (E1) from the Google Sheet, reusing it for IG_TOKEN_TTL seconds.
+        The confession count (D1) comes back in the same read and is kept for get_count.
         """
+        if self._ig_token_cache and time.monotonic() - self._ig_token_cache[1] < IG_TOKEN_TTL:
+            return self._ig_token_cache[0]
         try:
-            spreadsheet = self.client.open_by_url(self.sheet_url)
-            worksheet = spreadsheet.get_worksheet(0)
-
-            current_value = int(worksheet.cell(1, 4).value)
-            
-            # Assuming the count is stored in cell A1
-            worksheet.update_cell(1, 4, current_value + 1)
-            print(f"Updated confession count to {current_value + 1} in Google Sheet.")
-        
-        except Exception as e:
-            print(f"Error incrementing confession count: {e}")
-            return
-        
-    def get_instagram_access_token(self) -> str:
-        """Fetches the Instagram access token from the Google Sheet."""
-        try:
-            spreadsheet = self.client.open_by_url(self.sheet_url)
-            token = spreadsheet.get_worksheet(0).cell(1, 5).value
-            return token if token else ""
+            count, token = self.worksheet.get("D1:E1", maintain_size=True)[0]
+            if str(count).isdigit():
+                self._count = int(count)
+            if token:
+                self._ig_token_cache = (token, time.monotonic())
+            return token
         except Exception as e:
             print(f"Error getting Instagram access token: {e}")
+            self._forget_worksheet(e)
             return ""
 
     def set_instagram_access_token(self, token):
         """Sets the Instagram access token in the Google Sheet."""
         try:
-            spreadsheet = self.client.open_by_url(self.sheet_url)
-            worksheet = spreadsheet.get_worksheet(0)
-            worksheet.update_cell(1, 5, token)  # Assuming token is stored in cell E1
+            self.worksheet.update_cell(1, 5, token)  # Assuming token is stored in cell E1
+            self._ig_token_cache = (token, time.monotonic())
             print("Instagram access token updated successfully.")
         except Exception as e:
             print(f"Error updating Instagram access token: {e}")
+            self._forget_worksheet(e)
 
 if __name__ == "__main__":
     from dotenv import load_dotenv
@@ -183,12 +339,13 @@ if __name__ == "__main__":
             reader = GoogleFormReader(SHEET_URL)
             latest_confessions = reader.get_latest_confessions_from_sheet()
             for conf in latest_confessions:
-                print(f"Row: {conf[0]}, Timestamp: {conf[1]},  Text: {conf[2][:50]}...")
+                print(f"Row: {conf.row_num}, Timestamp: {conf.timestamp},  Text: {conf.text[:50]}...")
             
             # Example of marking processed (for first confession)
             if latest_confessions:
                 first_conf = latest_confessions[0]
-                reader.mark_confession_as_processed(first_conf[0], 1)
+                reader.queue_statuses([(first_conf.row_num, 1)])
+                reader.flush()
 
         except Exception as e:
             print(f"An error occurred: {e}")
\ No newline at end of file
@@ -1,67 +1,191 @@
 import requests
+from requests.adapters import HTTPAdapter
 import os
+import random
 import time
+import concurrent.futures
 import cloudinary
 import cloudinary.api
-from cloudinary.exceptions import Error
+from cloudinary.exceptions import Error, GeneralError, RateLimited
 import cloudinary.uploader
+from dataclasses import dataclass, field
 from typing import List
 from model import Confession
-from confession_image_generator import ConfessionImageGenerator
+from config import get_env
+from confession_image_generator import ConfessionImageGenerator, IMAGE_OUTPUT_DIR
 from reel_generator import FfmpegReelGenerator
 
 # --- Configuration ---
 FB_GRAPH_API_BASE = "https://graph.instagram.com/v21.0"
-INSTAGRAM_PAGE_ID = os.getenv("INSTAGRAM_PAGE_ID")
+# Seconds to wait on a Graph API request before giving up
+GRAPH_API_TIMEOUT = 30
+# Concurrent slide uploads and carousel item requests (Instagram allows at most 10 items)
+UPLOAD_WORKERS = 10
+# Keep-alive connections held open to the Graph API; enough for a full carousel fan-out plus headroom
+GRAPH_POOL_SIZE = 16
+# Bounded exponential backoff with jitter for transient Graph API and Cloudinary failures
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30
+RETRY_JITTER = 0.5
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
 
-# Cloudinary configuration
-cloudinary.config(
-    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.getenv("CLOUDINARY_API_KEY"),
-    api_secret=os.getenv("CLOUDINARY_API_SECRET")
-)
+# Uploads are only staging for Instagram to fetch, and every asset is deleted after the run:
+# no CDN invalidation, account-level backup copies or eager derivations for them
+STAGING_UPLOAD_OPTIONS = dict(overwrite=True, invalidate=False, backup=False, eager=None)
+
+# Appended to every post's caption
+HASHTAGS = "#IITKQuickConfessions #IITKConfessions #confession #iitk #iitkanpur #iit #jee #jeeadvanced #jeemains"
+
+def build_caption(caption: str | None, sigma_reply: str | None) -> str:
+    """Post caption: the admin reply when there is one, otherwise the summary caption, then the hashtags."""
+    return f"{f'Admin reply: {sigma_reply}\n' if sigma_reply else caption} \n\n{HASHTAGS}"
+
+def _build_session() -> requests.Session:
+    """Keep-alive session for the Graph API, so every call after the first skips the TCP/TLS handshake."""
+    session = requests.Session()
+    # Retries are handled by InstagramPoster._request_with_retry, which knows which calls are safe to repeat
+    session.mount("https://", HTTPAdapter(pool_maxsize=GRAPH_POOL_SIZE, max_retries=0))
+    return session
+
+def _retry_delay(attempt: int, retry_after: str | None = None) -> float:
+    """Seconds to wait before retry number attempt+1, honouring a Retry-After header given in seconds."""
+    if retry_after and retry_after.isdigit():
+        return min(RETRY_MAX_DELAY, int(retry_after))
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt * (1 + random.uniform(0, RETRY_JITTER)))
+
+def _is_transient_cloudinary_error(error: Error) -> bool:
+    """
+    Rate limits (420/429) and server errors (500/503) are worth retrying, as is a bare Error, which
+    the uploader raises for socket and HTTP failures and unparseable (gateway) responses (the admin API
+    raises GeneralError for those). Other subclasses are 4xx responses (bad credentials, invalid file
+    or public_id) that will fail again.
+    """
+    return isinstance(error, (RateLimited, GeneralError)) or type(error) is Error
+
+def _cloudinary_with_retry(call, *args, **kwargs):
+    """
+    Runs a Cloudinary SDK call, retrying transient errors with backoff. Only for idempotent calls:
+    uploads to a fixed public_id, listing resources and deleting them.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return call(*args, **kwargs)
+        except Error as e:
+            if attempt == MAX_RETRIES or not _is_transient_cloudinary_error(e):
+                raise
+            delay = _retry_delay(attempt)
+            print(f"Cloudinary {call.__name__} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+@dataclass
+class RenderedMedia:
+    """Local files generated for one confession, ready to upload."""
+    is_reel: bool
+    paths: List[str] = field(default_factory=list)  # [image, video] on disk for a reel
+    slides: List[bytes] = field(default_factory=list)  # Encoded slide images for a carousel
 
 
 class InstagramPoster:
     def __init__(self):
         """Initialize Instagram Poster with configuration."""
+        env = get_env()
         self.fb_graph_api_base = FB_GRAPH_API_BASE
-        self.instagram_page_id = INSTAGRAM_PAGE_ID
+        self.instagram_page_id = env.instagram_page_id
+        self.session = _build_session()
         self.access_token = os.getenv("INSTAGRAM_ACCESS_TOKEN")
+
+        # Cloudinary configuration, applied here rather than at import so a .env loaded in __main__ is seen
+        cloudinary.config(
+            cloud_name=env.cloudinary_cloud_name,
+            api_key=env.cloudinary_api_key,
+            api_secret=env.cloudinary_api_secret
+        )
         
         # if not self.access_token:
         #     print("Warning: INSTAGRAM_ACCESS_TOKEN not set.")
 
-    def upload_images_to_cloudinary(self, image_paths: List[str], row_num: int) -> List[str]:
-        """Upload multiple images to Cloudinary and return URLs"""
-        public_urls = []
-        
-        for i, image_path in enumerate(image_paths, 1):
+    @property
+    def access_token(self) -> str | None:
+        return self._access_token
+
+    @access_token.setter
+    def access_token(self, token: str | None):
+        """Keeps the session's default Authorization header in step with the token, including after a refresh."""
+        self._access_token = token
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+        else:
+            self.session.headers.pop("Authorization", None)
+
+    def _request_with_retry(self, method: str, url: str, idempotent: bool = True, **kwargs) -> requests.Response:
+        """
+        Graph API request retried on connection errors, timeouts, 429 and 5xx, with backoff and jitter.
+        Other responses are returned as they are for the caller to check. Calls that are not idempotent
+        (media_publish) are only retried on 429, where the request was certainly not acted on: after a
+        timeout or 5xx the post may have gone out, and a retry could publish it twice.
+        """
+        kwargs.setdefault('timeout', GRAPH_API_TIMEOUT)
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if not idempotent or attempt == MAX_RETRIES:
+                    raise
+                delay = _retry_delay(attempt)
+                print(f"Graph API request failed ({e}), retrying in {delay:.1f}s")
+            else:
+                retryable = response.status_code == 429 or (idempotent and response.status_code in RETRYABLE_STATUS)
+                if not retryable or attempt == MAX_RETRIES:
+                    return response
+                delay = _retry_delay(attempt, response.headers.get('Retry-After'))
+                print(f"Graph API returned {response.status_code}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def upload_images_to_cloudinary(self, images: List[bytes], row_num: int) -> List[str]:
+        """Upload multiple encoded images to Cloudinary concurrently and return URLs in slide order"""
+        def upload(i: int, image: bytes) -> str:
             try:
                 public_id = f"confessions/confession_{row_num}_slide_{i}"
-                response = cloudinary.uploader.upload(
-                    image_path,
+                response = _cloudinary_with_retry(
+                    cloudinary.uploader.upload,
+                    image,
                     public_id=public_id,
-                    overwrite=True,
-                    resource_type="image"
+                    resource_type="image",
+                    **STAGING_UPLOAD_OPTIONS
                 )
-                public_urls.append(response['secure_url'])
                 print(f"Uploaded slide {i} to Cloudinary: {response['secure_url']}")
+                return response['secure_url']
             except Exception as e:
                 print(f"Error uploading slide {i} to Cloudinary: {e}")
-                return []
+                return ""
         
-        return public_urls
+        if not images:
+            return []
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(UPLOAD_WORKERS, len(images)))
+        try:
+            futures = {executor.submit(upload, i, image): i for i, image in enumerate(images, start=1)}
+            public_urls = [""] * len(images)
+            for future in concurrent.futures.as_completed(futures):
+                url = future.result()
+                if not url:
+                    # One missing slide sinks the carousel; don't wait on uploads that haven't started
+                    return []
+                public_urls[futures[future] - 1] = url
+            return public_urls
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
 
     def upload_video_to_cloudinary(self, video_path: str, row_num: int) -> str:
         """Upload video to Cloudinary and return URL"""
         try:
             public_id = f"confessions/confession_{row_num}_reel"
-            response = cloudinary.uploader.upload(
+            response = _cloudinary_with_retry(
+                cloudinary.uploader.upload,
                 video_path,
                 public_id=public_id,
-                overwrite=True,
-                resource_type="video"
+                resource_type="video",
+                **STAGING_UPLOAD_OPTIONS
             )
             print(f"Uploaded reel to Cloudinary: {response['secure_url']}")
             return response['secure_url']
@@ -83,14 +207,8 @@ class InstagramPoster:
         # Create carousel container
         url = f"{self.fb_graph_api_base}/me/media"
         
-        # First, create media objects for each image
-        media_ids = []
-        for image_url in image_urls:
-
-            headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.access_token}"
-            }
+        # First, create media objects for each image, all requests in flight at once
+        def create_item(image_url: str) -> str:
             params = {
                 'image_url': image_url,
                 'caption': caption,
@@ -98,32 +216,44 @@ class InstagramPoster:
             }
             
             try:
-                response = requests.post(url, headers=headers, params=params)
+                response = self._request_with_retry('POST', url, params=params)
                 response.raise_for_status()
-                media_id = response.json().get('id')
-                media_ids.append(media_id)
                 print(f"Created carousel item")
+                return response.json().get('id')
             except requests.exceptions.RequestException as e:
                 print(f"Error creating carousel item: {e}")
                 return ""
         
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(UPLOAD_WORKERS, len(image_urls)))
+        try:
+            futures = {executor.submit(create_item, image_url): i for i, image_url in enumerate(image_urls)}
+            # Indexed by slide, since the carousel's children list must follow the slide order
+            media_ids = [""] * len(image_urls)
+            for future in concurrent.futures.as_completed(futures):
+                media_id = future.result()
+                if not media_id:
+                    return ""
+                media_ids[futures[future]] = media_id
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        
         # Create carousel container
         carousel_params = {
             'media_type': 'CAROUSEL',
             'children': ','.join(media_ids),
-            'caption': f"{f'Admin reply: {sigma_reply}\n' if sigma_reply else caption} \n\n#IITKQuickConfessions #IITKConfessions #confession #iitk #iitkanpur #iit #jee #jeeadvanced #jeemains",
-            'access_token': self.access_token
+            'caption': build_caption(caption, sigma_reply),
         }
         
         try:
-            response = requests.post(url, params=carousel_params)
+            response = self._request_with_retry('POST', url, params=carousel_params)
             response.raise_for_status()
             carousel_id = response.json().get('id')
             print(f"Created carousel container")
             return carousel_id
         except requests.exceptions.RequestException as e:
             print(f"Error creating carousel container: {e}")
-            print(f"Response: {response.text}")
+            if getattr(e, 'response', None) is not None:
+                print(f"Response: {e.response.text}")
             return ""
 
     def create_instagram_reel(self, video_url: str, caption: str | None, sigma_reply: str | None) -> str:
@@ -134,18 +264,14 @@ class InstagramPoster:
         
         url = f"{self.fb_graph_api_base}/{self.instagram_page_id}/media"
         
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.access_token}"
-        }
         data = {
             'media_type': 'REELS',
             'video_url': video_url,
-            'caption': f"{f'Admin reply: {sigma_reply}\n' if sigma_reply else caption}  \n\n#IITKQuickConfessions #IITKConfessions #confession #iitk #iitkanpur #iit #jee #jeeadvanced #jeemains",
+            'caption': build_caption(caption, sigma_reply),
         }
         
         try:
-            response = requests.post(url, headers=headers, json=data)
+            response = self._request_with_retry('POST', url, json=data)
             response.raise_for_status()
             media_container_id = response.json().get('id', '')
             print(f"Reel media container created: {media_container_id}")
@@ -156,6 +282,39 @@ class InstagramPoster:
                 print(f"Response: {e.response.text}")
             return ""
 
+    def wait_for_container_ready(self, media_container_id: str, max_wait: float) -> bool:
+        """
+        Polls the container's status_code with backoff (0.5s doubling, capped at 5s) until it is FINISHED.
+        Returns False if Instagram reports an ERROR or EXPIRED container; after max_wait seconds the
+        publish is attempted anyway.
+        """
+        url = f"{self.fb_graph_api_base}/{media_container_id}"
+        params = {
+            'fields': 'status_code',
+        }
+        deadline = time.monotonic() + max_wait
+        delay = 0.5
+
+        while True:
+            try:
+                response = self.session.get(url, params=params, timeout=GRAPH_API_TIMEOUT)
+                response.raise_for_status()
+                status = response.json().get('status_code')
+                if status == 'FINISHED':
+                    return True
+                if status in ('ERROR', 'EXPIRED'):
+                    print(f"Media container {media_container_id} failed with status {status}")
+                    return False
+            except requests.exceptions.RequestException as e:
+                print(f"Error checking media container status: {e}")
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"Media container not ready after {max_wait}s, trying to publish anyway.")
+                return True
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 5)
+
     def publish_instagram_post(self, media_container_id: str) -> bool:
         """Publish the media container to Instagram"""
         if not self.instagram_page_id or not self.access_token:
@@ -164,11 +323,10 @@ class InstagramPoster:
         url = f"{self.fb_graph_api_base}/{self.instagram_page_id}/media_publish"
         params = {
             'creation_id': media_container_id,
-            'access_token': self.access_token
         }
 
         try:
-            response = requests.post(url, params=params)
+            response = self._request_with_retry('POST', url, idempotent=False, params=params)
             response.raise_for_status()
             post_id = response.json().get('id')
             print(f"Successfully published post with ID: {post_id}")
@@ -177,9 +335,12 @@ class InstagramPoster:
             print(f"Error publishing post: {e}")
             return False
 
-    def schedule_instagram_post(self, confession: Confession) -> bool:
-        """Main function to process confession and post to Instagram"""
-        print(f"Processing confession: {confession.timestamp}")
+    def render_media(self, confession: Confession) -> RenderedMedia | None:
+        """
+        Generates the files to post: a reel image and video for a single slide, slide images otherwise.
+        Makes no network calls, so it can run ahead of the posting of the previous confession.
+        """
+        print(f"Rendering confession: {confession.timestamp}")
         
         # Initialize image generator
         generator = ConfessionImageGenerator(confession)
@@ -202,10 +363,10 @@ class InstagramPoster:
             
             if not reel_image_path:
                 print("Failed to generate reel image.")
-                return False
+                return None
             
             # Generate reel video using FFmpeg
-            reel_output_path = os.path.join("generated_images", f"confession_{confession.row_num}_reel.mp4")
+            reel_output_path = os.path.join(IMAGE_OUTPUT_DIR, f"confession_{confession.row_num}_reel.mp4")
             audio_path = "assets/audio1.mp3"
             
             reel_gen = FfmpegReelGenerator(reel_image_path, reel_output_path, audio_path)
@@ -218,7 +379,36 @@ class InstagramPoster:
                     os.remove(reel_image_path)
                 except:
                     pass
-                return False
+                return None
+            
+            return RenderedMedia(is_reel=True, paths=[reel_image_path, reel_video_path])
+        else:
+            # Multiple slides - create carousel
+            print("Multiple slides detected. Creating carousel...")
+            
+            # Generate images (carousel)
+            images = generator.generate_confession_images()
+            
+            if not images:
+                print("Failed to generate images.")
+                return None
+            
+            return RenderedMedia(is_reel=False, slides=images)
+
+    def schedule_instagram_post(self, confession: Confession, media: RenderedMedia | None) -> bool:
+        """
+        Main function to process confession and post to Instagram.
+        media comes from render_media; if rendering failed (None) the post fails rather than
+        re-rendering here, which could race the renderer thread on the generator's shared caches.
+        """
+        print(f"Processing confession: {confession.timestamp}")
+        
+        if media is None:
+            print(f"No rendered media for confession {confession.timestamp}")
+            return False
+        
+        if media.is_reel:
+            reel_image_path, reel_video_path = media.paths
             
             # Upload reel to Cloudinary
             reel_url = self.upload_video_to_cloudinary(reel_video_path, confession.row_num)
@@ -237,9 +427,9 @@ class InstagramPoster:
             
             if media_container_id:
                 print("Waiting for Instagram to process reel...")
-                time.sleep(30)  # Reels may need more time to process
-                
-                success = self.publish_instagram_post(media_container_id)
+                # Reels may need more time to process
+                success = (self.wait_for_container_ready(media_container_id, max_wait=120)
+                           and self.publish_instagram_post(media_container_id))
                 if success:
                     print(f"Successfully posted reel for confession {confession.timestamp} to Instagram!")
                     # Clean up local files
@@ -258,18 +448,8 @@ class InstagramPoster:
                 pass
             return False
         else:
-            # Multiple slides - create carousel
-            print("Multiple slides detected. Creating carousel...")
-            
-            # Generate images (carousel)
-            image_paths = generator.generate_confession_images()
-            
-            if not image_paths:
-                print("Failed to generate images.")
-                return False
-            
             # Upload to Cloudinary
-            public_urls = self.upload_images_to_cloudinary(image_paths, confession.row_num)
+            public_urls = self.upload_images_to_cloudinary(media.slides, confession.row_num)
             if not public_urls:
                 print("Failed to upload images to Cloudinary")
                 return False
@@ -279,17 +459,10 @@ class InstagramPoster:
             
             if media_container_id:
                 print("Waiting for Instagram to process media...")
-                time.sleep(20)  # Give Instagram time to process
-                
-                success = self.publish_instagram_post(media_container_id)
+                success = (self.wait_for_container_ready(media_container_id, max_wait=60)
+                           and self.publish_instagram_post(media_container_id))
                 if success:
                     print(f"Successfully posted confession {confession.timestamp} to Instagram!")
-                    # Clean up local images
-                    for image_path in image_paths:
-                        try:
-                            os.remove(image_path)
-                        except:
-                            pass
                     return True
             
             return False
@@ -302,7 +475,7 @@ class InstagramPoster:
             'access_token': self.access_token
         }
         try:
-            response = requests.get(url, params=params)
+            response = self._request_with_retry('GET', url, params=params)
             response.raise_for_status()
             new_token = response.json().get('access_token', '')
             if new_token:
@@ -326,65 +499,70 @@ class InstagramPoster:
 
         resource_types = ['image', 'video', 'raw'] # Add or remove types as needed
 
-        for r_type in resource_types:
-            print(f"\n--- Deleting {r_type.upper()} resources ---")
-            next_cursor = None
-            has_more = True
-            total_deleted = 0
+        # Each resource type is listed and deleted independently, so purge them side by side
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(resource_types)) as executor:
+            list(executor.map(self.delete_assets_of_type, resource_types))
 
-            while has_more:
-                try:
-                    # Use list_resources to get a batch of resource IDs
-                    # max_results can be up to 500
-                    response = cloudinary.api.resources(
-                        type="upload", # 'upload', 'private', 'authenticated'
-                        resource_type=r_type,
-                        max_results=500,
-                        next_cursor=next_cursor
-                    )
+        print("\n--- All specified resource types have been processed. ---")
+        print("It may take some time for changes to propagate and for CDN caches to clear.")
+
+    def delete_assets_of_type(self, r_type: str) -> int:
+        """
+        Deletes every uploaded asset of one resource type and returns how many were deleted.
+        The next page is listed while the current one is being deleted.
+        """
+        print(f"\n--- Deleting {r_type.upper()} resources ---")
+        total_deleted = 0
+
+        def list_page(next_cursor):
+            # Use list_resources to get a batch of resource IDs
+            # max_results can be up to 500
+            return _cloudinary_with_retry(
+                cloudinary.api.resources,
+                type="upload", # 'upload', 'private', 'authenticated'
+                resource_type=r_type,
+                max_results=500,
+                next_cursor=next_cursor
+            )
 
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as lister:
+            try:
+                response = list_page(None)
+                while True:
                     resources = response.get('resources', [])
                     if not resources:
                         print(f"No more {r_type} resources found.")
-                        has_more = False
-                        continue
+                        break
 
-                    public_ids = [res['public_id'] for res in resources]
+                    next_cursor = response.get('next_cursor')
+                    next_page = lister.submit(list_page, next_cursor) if next_cursor else None
 
-                    if public_ids:
-                        print(f"Found {len(public_ids)} {r_type} resources to delete. Deleting...")
-                        # Delete the resources
-                        delete_result = cloudinary.api.delete_resources(
-                            public_ids,
+                    public_ids = [res['public_id'] for res in resources]
+                    print(f"Found {len(public_ids)} {r_type} resources to delete. Deleting...")
+                    # delete_resources takes at most 100 public IDs per call
+                    for i in range(0, len(public_ids), 100):
+                        delete_result = _cloudinary_with_retry(
+                            cloudinary.api.delete_resources,
+                            public_ids[i:i + 100],
                             resource_type=r_type,
                             invalidate=True # Invalidate CDN cache for these assets
                         )
-                        total_deleted += len(public_ids)
-                        print(f"Deletion status for current batch: {delete_result}")
-                    else:
-                        print(f"No {r_type} public IDs to delete in this batch.")
+                        print(f"Deletion status for current {r_type} batch: {delete_result}")
+                    total_deleted += len(public_ids)
 
-                    next_cursor = response.get('next_cursor')
-                    if not next_cursor:
-                        has_more = False
+                    if next_page is None:
                         print(f"Finished processing all {r_type} resources.")
-                    else:
-                        print(f"Proceeding to next batch of {r_type} resources...")
-                        # Small delay to respect API rate limits, especially for very large accounts
-                        time.sleep(1)
+                        break
+                    print(f"Proceeding to next batch of {r_type} resources...")
+                    response = next_page.result()
 
-                except Error as e:
-                    print(f"Cloudinary API Error while deleting {r_type}: {e}")
-                    has_more = False # Stop on error
-                except Exception as e:
-                    print(f"An unexpected error occurred while deleting {r_type}: {e}")
-                    has_more = False # Stop on error
-
-            print(f"--- Total {r_type.upper()} resources deleted: {total_deleted} ---")
-
-        print("\n--- All specified resource types have been processed. ---")
-        print("It may take some time for changes to propagate and for CDN caches to clear.")
+            except Error as e:
+                print(f"Cloudinary API Error while deleting {r_type}: {e}")
+            except Exception as e:
+                print(f"An unexpected error occurred while deleting {r_type}: {e}")
 
+        print(f"--- Total {r_type.upper()} resources deleted: {total_deleted} ---")
+        return total_deleted
 
 if __name__ == "__main__":
     from dotenv import load_dotenv
@@ -415,9 +593,9 @@ if __name__ == "__main__":
     poster = InstagramPoster()
     
     print("Testing short confession...")
-    poster.schedule_instagram_post(short_confession)
+    poster.schedule_instagram_post(short_confession, poster.render_media(short_confession))
     
     print("\n" + "="*50 + "\n")
     
     print("Testing long confession (carousel)...")
-    poster.schedule_instagram_post(long_confession)
\ No newline at end of file
+    poster.schedule_instagram_post(long_confession, poster.render_media(long_confession))
\ No newline at end of file
@@ -1,20 +1,24 @@
 import os
+import asyncio
+import concurrent.futures
 from datetime import datetime
 
 # Import the new class-based modules
 from google_form_reader import GoogleFormReader
 from gemini_processor import GeminiProcessor
 from insta_poster import InstagramPoster
+from config import get_env
 from model import Confession, ModerationResponse
 from typing import List
 
 class ConfessionAutomation:
     def __init__(self):
         """Initialize the confession automation system."""
-        self.sheet_url = os.getenv("GOOGLE_SHEET_URL")
-        self.credentials_json_base64 = os.getenv("GOOGLE_SHEETS_CREDENTIALS_FILE")
-        self.instagram_page_id = os.getenv("INSTAGRAM_PAGE_ID")
-        self.max_confession_per_run = int(os.getenv("MAX_CONFESSION_PER_RUN", 4))
+        self.env = get_env()
+        self.sheet_url = self.env.sheet_url
+        self.credentials_json_base64 = self.env.sheets_credentials_b64
+        self.instagram_page_id = self.env.instagram_page_id
+        self.max_confession_per_run = self.env.max_confession_per_run
         
         # Initialize components
         self.google_reader = None
@@ -68,6 +72,11 @@ class ConfessionAutomation:
         """Main method to process confessions from start to finish."""
         print(f"Starting confession automation at {datetime.now()}")
 
+        missing = self.env.missing()
+        if missing:
+            print(f"Missing configuration: {', '.join(missing)}. Exiting.")
+            return
+
         # Setup components
         if not self.setup_components():
             print("Failed to setup components. Exiting.")
@@ -97,19 +106,12 @@ class ConfessionAutomation:
             print("No new confessions found in the Google Sheet.")
             return
 
-        # Process and moderate confessions
-        shortlisted_posts = self.moderate_confessions(new_confessions)
-        
+        # All Gemini calls share one event loop, which the client's async connection pool is bound to
+        shortlisted_posts = asyncio.run(self.moderate_and_select(new_confessions))
+
         if not shortlisted_posts:
             print("No safe confessions found for posting.")
             return
-
-        # Select top confessions
-        print(f"Selecting top {self.max_confession_per_run} confessions based on creativity and potential reach...")
-        shortlisted_posts = self.gemini_processor.select_top_confessions(
-            shortlisted_posts, 
-            max_count=self.max_confession_per_run
-        )
         print(f"Selected {len(shortlisted_posts)} top confessions for posting.")
 
         # Schedule posts and track which ones were attempted
@@ -125,30 +127,68 @@ class ConfessionAutomation:
             
             # Confessions that were never selected for posting (rejected)
             rejected_rows = set(total_rows) - set(shortlisted_rows)
+            self.google_reader.queue_statuses([(row, 0) for row in rejected_rows])
             for row in rejected_rows:
-                self.google_reader.mark_confession_as_processed(row, 0)
-                print(f"Marked row {row} as NOT POSTED (rejected during selection) in Google Sheet.")
+                print(f"Marking row {row} as NOT POSTED (rejected during selection) in Google Sheet.")
         else:
             print("No posts were attempted. System may have failed. Not marking confessions as processed.")
 
+        # Post statuses, rejections and the new count are written in a single batch update
+        self.google_reader.flush()
+
         # Cleanup
         self.instagram_poster.delete_all_assets()
         print(f"Confession automation finished at {datetime.now()}")
 
-    def moderate_confessions(self, new_confessions: List[Confession]) -> List[Confession]:
-        """Moderate confessions using Gemini and return safe ones."""
-        shortlisted_confessions = []
-        
+    def filter_eligible(self, new_confessions: List[Confession]) -> List[Confession]:
+        """Drop confessions too short to be worth moderating."""
+        eligible_confessions = []
         for confession in new_confessions:
-            print(f"\nProcessing confession ID: {confession.timestamp}")
-
             if len(confession.text) < 60:
                 print(f"Confession ID {confession.timestamp} is too short to process. Skipping.")
                 continue
-            
-            # Moderate and shortlist using Gemini
-            gemini_result: ModerationResponse = self.gemini_processor.moderate_and_shortlist_confession(confession.text)
+            eligible_confessions.append(confession)
+        return eligible_confessions
+
+    async def moderate_and_select(self, new_confessions: List[Confession]) -> List[Confession]:
+        """
+        Moderate and select top confessions in a single Gemini request, falling back to
+        separate moderation and selection when the combined response is unusable.
+        """
+        print(f"Moderating and selecting top {self.max_confession_per_run} confessions based on creativity and potential reach...")
+        shortlisted_posts = await self.gemini_processor.process_confessions_bulk_async(
+            self.filter_eligible(new_confessions),
+            max_count=self.max_confession_per_run
+        )
+        if shortlisted_posts is not None:
+            return shortlisted_posts
+
+        print("Combined moderation and selection not usable. Falling back to separate moderation and selection.")
 
+        # Process and moderate confessions
+        shortlisted_posts = await self.moderate_confessions(new_confessions)
+        if not shortlisted_posts:
+            return []
+
+        # Select top confessions
+        print(f"Selecting top {self.max_confession_per_run} confessions based on creativity and potential reach...")
+        return await self.gemini_processor.select_top_confessions_async(
+            shortlisted_posts,
+            max_count=self.max_confession_per_run
+        )
+
+    async def moderate_confessions(self, new_confessions: List[Confession]) -> List[Confession]:
+        """Moderate confessions using Gemini and return safe ones."""
+        shortlisted_confessions = []
+        eligible_confessions = self.filter_eligible(new_confessions)
+
+        # Moderate and shortlist using Gemini, all requests in flight concurrently
+        gemini_results: List[ModerationResponse] = await self.gemini_processor.moderate_batch(
+            [confession.text for confession in eligible_confessions]
+        )
+
+        for confession, gemini_result in zip(eligible_confessions, gemini_results):
+            print(f"\nProcessing confession ID: {confession.timestamp}")
             
             if gemini_result.is_safe:
                 print(f"Confession deemed SAFE. Sentiment: {gemini_result.sentiment}")
@@ -165,32 +205,56 @@ class ConfessionAutomation:
         """
         Schedule posts using Instagram Graph API.
         Returns a set of row numbers that were attempted (successfully or not).
+        The count and statuses are tracked locally and queued on the reader, to be written back in one go.
         """
         attempted_rows = set()
-        
-        for i, post_data in enumerate(shortlisted_posts):
-            print(f"Attempting to schedule post {i+1}/{len(shortlisted_posts)}...")
-            count = self.google_reader.get_count()
-            post_data.count = count + 1
-            
-            try:
-                # Use the Instagram poster to schedule the post
-                if self.instagram_poster.schedule_instagram_post(post_data):
-                    print(f"Successfully scheduled confession ID: {post_data.timestamp} to Instagram!")
-                    # Mark as processed in sheet with status 1 (success)
-                    self.google_reader.increment_count()
-                    self.google_reader.mark_confession_as_processed(post_data.row_num, 1)
-                    attempted_rows.add(post_data.row_num)
-                else:
-                    print(f"Failed to schedule post for confession ID: {post_data.timestamp}")
-                    # Mark as processed in sheet with status 0 (failed)
-                    self.google_reader.mark_confession_as_processed(post_data.row_num, 0)
+        statuses = []
+        initial_count = count = self.google_reader.get_count()
+
+        # One worker keeps rendering serial (the image generator's canvas cache isn't thread-safe)
+        # while the next confession renders during the current one's uploads and publish wait.
+        renderer = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+        def render(post: Confession, number: int) -> concurrent.futures.Future:
+            post.count = number
+            return renderer.submit(self.instagram_poster.render_media, post)
+
+        pending = render(shortlisted_posts[0], count + 1) if shortlisted_posts else None
+
+        try:
+            for i, post_data in enumerate(shortlisted_posts):
+                print(f"Attempting to schedule post {i+1}/{len(shortlisted_posts)}...")
+                media_future = pending
+                if post_data.count != count + 1:
+                    # Rendered assuming the previous post would succeed; redo it with the right number
+                    media_future = render(post_data, count + 1)
+                # Assume this post goes out and start rendering the next one
+                if i + 1 < len(shortlisted_posts):
+                    pending = render(shortlisted_posts[i + 1], count + 2)
+                
+                try:
+                    # Use the Instagram poster to schedule the post
+                    if self.instagram_poster.schedule_instagram_post(post_data, media_future.result()):
+                        print(f"Successfully scheduled confession ID: {post_data.timestamp} to Instagram!")
+                        # Mark as processed in sheet with status 1 (success)
+                        count += 1
+                        statuses.append((post_data.row_num, 1))
+                        attempted_rows.add(post_data.row_num)
+                    else:
+                        print(f"Failed to schedule post for confession ID: {post_data.timestamp}")
+                        # Mark as processed in sheet with status 0 (failed)
+                        statuses.append((post_data.row_num, 0))
+                        attempted_rows.add(post_data.row_num)
+                except Exception as e:
+                    print(f"Error scheduling post for confession ID: {post_data.timestamp}: {e}")
+                    # Mark as attempted but failed
                     attempted_rows.add(post_data.row_num)
-            except Exception as e:
-                print(f"Error scheduling post for confession ID: {post_data.timestamp}: {e}")
-                # Mark as attempted but failed
-                attempted_rows.add(post_data.row_num)
-                self.google_reader.mark_confession_as_processed(post_data.row_num, 0)
+                    statuses.append((post_data.row_num, 0))
+        finally:
+            renderer.shutdown(cancel_futures=True)
+            # Queued even if the loop is interrupted, and flushed at exit at the latest,
+            # so posted confessions are never re-posted.
+            self.google_reader.queue_statuses(statuses, count if count != initial_count else None)
         
         return attempted_rows        
 
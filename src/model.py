@@ -1,6 +1,8 @@
-from typing import Optional, List
+from typing import Literal, Optional, List
 from dataclasses import dataclass
 
+Sentiment = Literal["Positive", "Negative", "Neutral", "Mixed"]
+
 @dataclass
 class Confession:
     timestamp: str
@@ -22,5 +24,22 @@ class ModerationResponse:
     """Response schema for confession moderation."""
     is_safe: bool
     rejection_reason: str
-    sentiment: str
-    summary_caption: str
\ No newline at end of file
+    sentiment: Sentiment
+    summary_caption: str
+
+@dataclass
+class IndexedModerationResponse:
+    """Response schema for one confession in a batched moderation request."""
+    index: int
+    is_safe: bool
+    rejection_reason: str
+    sentiment: Sentiment
+    summary_caption: str
+
+
+@dataclass
+class BulkProcessingResponse:
+    """Response schema for moderating and selecting confessions in one request."""
+    items: List[IndexedModerationResponse]
+    indices: List[int]
+    admin_replies: List[str]
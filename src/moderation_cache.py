@@ -0,0 +1,76 @@
+import hashlib
+import json
+import math
+import os
+import sqlite3
+from array import array
+from dataclasses import asdict
+from typing import List, Optional
+from model import ModerationResponse
+
+# Used unless MODERATION_CACHE_PATH is set
+DEFAULT_MODERATION_CACHE_PATH = ".gemini_cache.db"
+
+class ModerationCache:
+    """Content-addressed store of moderation verdicts, backed by a local SQLite file."""
+
+    def __init__(self, path: Optional[str] = None):
+        # Read on construction rather than import, so a .env loaded in __main__ is seen
+        path = path or os.getenv("MODERATION_CACHE_PATH", DEFAULT_MODERATION_CACHE_PATH)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS moderation (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS rejected_embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(model: str, template_version: str, confession_text: str) -> str:
+        """SHA-256 of the model, prompt template version and confession text."""
+        return hashlib.sha256(f"{model}\0{template_version}\0{confession_text}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[ModerationResponse]:
+        row = self.conn.execute("SELECT value FROM moderation WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return ModerationResponse(**json.loads(row[0]))
+
+    def set(self, key: str, result: ModerationResponse):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO moderation (key, value) VALUES (?, ?)",
+            (key, json.dumps(asdict(result))),
+        )
+        self.conn.commit()
+
+    def add_rejected_embedding(self, key: str, vector: List[float]):
+        """Stores the unit-normalised embedding of a rejected confession for similarity lookups."""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO rejected_embeddings (key, vector) VALUES (?, ?)",
+            (key, _normalise(vector).tobytes()),
+        )
+        self.conn.commit()
+
+    def similar_rejection(self, vector: List[float], threshold: float) -> Optional[ModerationResponse]:
+        """Returns the verdict of the most similar rejected confession if its cosine similarity reaches threshold."""
+        query = _normalise(vector)
+        best_score, best_value = threshold, None
+        rows = self.conn.execute(
+            "SELECT m.value, e.vector FROM rejected_embeddings e JOIN moderation m ON m.key = e.key"
+        )
+        for value, blob in rows:
+            stored = array("f")
+            stored.frombytes(blob)
+            if len(stored) != len(query):
+                continue
+            score = sum(a * b for a, b in zip(query, stored))
+            if score >= best_score:
+                best_score, best_value = score, value
+        if best_value is None:
+            return None
+        return ModerationResponse(**json.loads(best_value))
+
+def _normalise(vector: List[float]) -> array:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return array("f", (x / norm for x in vector))